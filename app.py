@@ -1,7 +1,12 @@
 import json
 import os
+import queue
+import time
+from datetime import datetime, timedelta, timezone
 
+import click
 from dotenv import load_dotenv
+from psycopg2.errors import QueryCanceled, UniqueViolation
 from flask import (
     Flask,
     request,
@@ -11,34 +16,56 @@ from flask import (
     redirect,
     url_for,
     make_response,
+    Response,
+    g,
 )
-
+from jinja2 import FileSystemBytecodeCache
+
+from db.connection import (
+    checked_out,
+    ping_database,
+    pool_stats,
+    put_leftover_conns,
+    read_from_primary,
+    wrote_to_primary,
+)
+from db.query_counter import query_count, query_log, start_counting
 from db.queries import (
     get_user_by_email,
-    get_user_by_net_id,
     get_user_by_id,
+    get_calendar_feed_version,
     get_user_signups,
+    get_user_signup_history,
     create_new_user,
     get_all_current_opportunities,
     get_opportunity_details,
     get_all_user_orgs,
-    get_org_by_name,
     create_new_org,
     get_org_details,
+    get_org_details_page,
     get_all_current_opportunities_for_org,
-    get_opportunity_for_org_by_title,
     create_new_opportunity,
+    create_new_opportunities_bulk,
+    get_existing_opportunity_titles_for_org,
     get_all_signups_for_org,
     delete_user_signup,
+    update_signup_status_for_org,
     get_signup_by_user_and_opp,
     create_new_signup,
     get_signup_count_for_opp,
     get_max_signups,
+    get_opportunities_capacity,
+    reconcile_signup_counts,
     update_org,
     delete_org,
     delete_opp,
     update_opp,
-    get_all_non_user_orgs,
+    get_dashboard_organizations,
+    get_recommended_opportunities,
+    get_popular_opportunities,
+    reset_calendar_feed,
+    refresh_recommendations,
+    archive_ended_opportunities,
     get_user_by_email_and_password_sql_injection,
 )
 from utils.auth import (
@@ -46,9 +73,36 @@ from utils.auth import (
     hash_password,
     login_required,
     is_representative,
-    is_authorized_to_delete_signup,
 )
-from utils.image_uploader import upload_image
+from utils.auth_cache import representative_cache
+from utils.cache import MISSING
+from utils.calendar_feed import (
+    calendar_cache,
+    load_calendar_token,
+    make_calendar_token,
+    render_feed,
+)
+from utils.capacity_events import capacity_broadcaster, capacity_event
+from utils.csv_importer import parse_opportunity_csv
+from utils.image_uploader import (
+    delete_uploaded_image,
+    register_template_filters,
+    upload_image,
+)
+from utils.load_shedding import get_limiter, limit_concurrency, overloaded_response
+from utils.profiler import (
+    PROFILE_HEADER,
+    is_valid_profile_token,
+    make_profile_token,
+    request_profiler,
+)
+from utils.query_budget import (
+    QUERY_BUDGET_MODE,
+    QueryBudgetExceeded,
+    query_budget,
+    query_budget_problems,
+)
+from utils.signup_queue import SIGNUP_QUEUE_ENABLED, signup_queue
 from utils.validator import (
     validate_email,
     validate_not_empty,
@@ -59,13 +113,147 @@ from utils.validator import (
     validate_date,
     validate_start_end_dates,
     validate_max_signups,
+    validate_signup_status,
     compare_date_with_today,
 )
 
 load_dotenv()
 
+PRODUCTION = os.getenv("APP_ENV", "development") == "production"
+
+# compiled templates are kept on disk so a new worker does not compile them
+# again on its first hit to every page
+JINJA_CACHE_DIR = os.getenv("JINJA_CACHE_DIR") or os.path.join(
+    os.path.dirname(__file__), ".jinja_cache"
+)
+os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+
 app = Flask(__name__, template_folder="templates")
 app.secret_key = os.getenv("SECRET_KEY")
+app.jinja_options = {
+    **app.jinja_options,
+    "bytecode_cache": FileSystemBytecodeCache(JINJA_CACHE_DIR),
+}
+# templates do not change under a running production worker, skip the mtime checks
+app.config["TEMPLATES_AUTO_RELOAD"] = not PRODUCTION
+
+# resized derivatives of uploaded images for the templates
+register_template_filters(app)
+
+# number of signups shown per opportunity on the manage signups tab
+SIGNUPS_PAGE_SIZE = 50
+
+# number of other organizations shown per page on the dashboard
+ORGS_PAGE_SIZE = 24
+
+# number of opportunities shown per page on an organization's public page
+ORG_OPPORTUNITIES_PAGE_SIZE = 24
+
+# number of recommended opportunities shown per page on the dashboard
+RECOMMENDATIONS_PAGE_SIZE = 12
+
+# number of archived signups shown per page on the profile history tab
+HISTORY_PAGE_SIZE = 20
+
+# seconds after a write during which a user's reads skip the read replica
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+# /readyz fails once this share of a pool's connections is in use, or when a
+# pool refused a connection within the last READY_REFUSED_WINDOW seconds
+READY_POOL_SATURATION = float(os.getenv("READY_POOL_SATURATION", "0.9"))
+READY_REFUSED_WINDOW = float(os.getenv("READY_REFUSED_WINDOW", "10"))
+
+# a capacity stream is closed after this many seconds and the browser's
+# EventSource reconnects, so no worker is held by one page forever
+CAPACITY_STREAM_MAX_SECONDS = int(os.getenv("CAPACITY_STREAM_MAX_SECONDS", "300"))
+
+# open capacity streams per worker, each one holds a worker thread
+capacity_stream_limiter = get_limiter("capacity_streams", 32)
+
+# how long a token from `flask profile-token` stays valid, in seconds
+PROFILER_TOKEN_MAX_AGE = int(os.getenv("PROFILER_TOKEN_MAX_AGE", "3600"))
+
+
+# ************************
+# db connection handling
+# ************************
+@app.before_request
+def route_reads():
+    # a request that writes checks its preconditions (duplicates, capacity,
+    # ownership) against the primary, a lagging replica could let it through
+    read_from_primary.set(
+        request.method not in ("GET", "HEAD")
+        or time.time() < session.get("primary_until", 0)
+    )
+    wrote_to_primary.set(False)
+    checked_out.set([])
+    start_counting()
+
+
+@app.after_request
+def remember_write(response):
+    # the replica may lag behind, keep this user on the primary for a moment so
+    # they see what they just changed
+    if wrote_to_primary.get() and "user_id" in session:
+        session["primary_until"] = time.time() + READ_YOUR_WRITES_SECONDS
+
+    return response
+
+
+@app.after_request
+def check_query_budget(response):
+    queries = query_log.get()
+    if QUERY_BUDGET_MODE == "off" or queries is None or request.endpoint is None:
+        return response
+
+    problems = query_budget_problems(app.view_functions[request.endpoint], queries)
+    if problems:
+        message = f"{request.endpoint} " + "; ".join(problems)
+
+        if QUERY_BUDGET_MODE == "strict":
+            raise QueryBudgetExceeded(message)
+
+        app.logger.warning("query budget exceeded: %s", message)
+
+    return response
+
+
+@app.teardown_request
+def return_leftover_conns(exc):
+    put_leftover_conns()
+
+
+# a query that ran past its statement timeout, shed the request like an overload
+@app.errorhandler(QueryCanceled)
+def query_timed_out(e):
+    return overloaded_response()
+
+
+# ************************
+# request profiling
+# ************************
+@app.before_request
+def start_profiling():
+    token = request.headers.get(PROFILE_HEADER)
+    if not token:
+        return
+
+    if is_valid_profile_token(token, app.secret_key, PROFILER_TOKEN_MAX_AGE):
+        if request_profiler.allow():
+            g.profile_run = request_profiler.start()
+
+
+@app.teardown_request
+def finish_profiling(exc):
+    run = g.pop("profile_run", None)
+    if run is None:
+        return
+
+    run.stop()
+    run.dump(
+        request_profiler.output_dir,
+        {"endpoint": request.endpoint, "queries": query_count()},
+    )
 
 
 # @app.before_request
@@ -115,6 +303,7 @@ def privacy():
 # login, register, and logout routes
 # ************************
 @app.route("/login-sql-injection", methods=["GET", "POST"])
+@query_budget(1)
 def login_sql_injection():
     # if user is already logged in, return
     if "user_id" in session:
@@ -155,6 +344,7 @@ def login_sql_injection():
 
 
 @app.route("/login", methods=["GET", "POST"])
+@query_budget(1)
 def login():
     # if user is already logged in, return
     if "user_id" in session:
@@ -214,6 +404,7 @@ def login():
 
 
 @app.route("/register", methods=["GET", "POST"])
+@query_budget(1)
 def register():
     # if user is already logged in, return
     if "user_id" in session:
@@ -248,18 +439,18 @@ def register():
 
             return render_template("partials/flash_messages.html")
 
-        # check if the user already exists in db
-        if get_user_by_email(email) or get_user_by_net_id(net_id):
-            flash("The user already exists", "error")
-            return render_template("partials/flash_messages.html")
-
         # hash the user's password
         hashed_password = hash_password(password).decode("utf-8")
 
-        # insert the user into the users table and store the user id
-        user_id = create_new_user(
-            first_name, last_name, net_id, email, hashed_password, role
-        )
+        # insert the user into the users table and store the user id, the
+        # unique email and net id constraints reject existing users
+        try:
+            user_id = create_new_user(
+                first_name, last_name, net_id, email, hashed_password, role
+            )
+        except UniqueViolation:
+            flash("The user already exists", "error")
+            return render_template("partials/flash_messages.html")
 
         # add user data to session
         session["user_id"] = user_id
@@ -298,6 +489,7 @@ def logout():
 # ************************
 @app.route("/profile", methods=["GET"])
 @login_required
+@query_budget(2)
 def profile():
     user_id = session.get("user_id")
     user = get_user_by_id(user_id)
@@ -305,17 +497,112 @@ def profile():
     return render_template("profile.html", user=user)
 
 
+def calendar_feed_url(user_id: int, version: int) -> str:
+    return url_for(
+        "calendar_feed",
+        token=make_calendar_token(app.secret_key, user_id, version),
+        _external=True,
+    )
+
+
 @app.route("/profile/tabs/signups", methods=["GET"])
 @login_required
+@query_budget(2)
 def profile_signups():
     user_id = session["user_id"]
     signups = get_user_signups(user_id)
+    calendar_url = calendar_feed_url(user_id, get_calendar_feed_version(user_id))
+
+    return render_template(
+        "partials/profile_signups.html", signups=signups, calendar_url=calendar_url
+    )
+
+
+# revokes every calendar link of the user and hands out a new one
+@app.route("/calendar/reset", methods=["POST"])
+@login_required
+@query_budget(1)
+def calendar_feed_reset():
+    user_id = session["user_id"]
+    calendar_url = calendar_feed_url(user_id, reset_calendar_feed(user_id))
+
+    response = make_response(
+        render_template("partials/calendar_link.html", calendar_url=calendar_url)
+    )
+    response.headers["HX-Trigger"] = json.dumps(
+        {
+            "showToast": {
+                "message": "Your calendar link was reset, subscribe again with the new one",
+                "type": "success",
+                "fromHTMX": True,
+            }
+        }
+    )
+    return response
+
+
+# calendar apps poll this without a session, the token in the url identifies
+# the user and the version of their link
+@app.route("/calendar/<token>.ics", methods=["GET"])
+@query_budget(2)
+def calendar_feed(token: str):
+    token = load_calendar_token(app.secret_key, token)
+    if token is None:
+        return make_response("", 404)
+
+    user_id, version = token
+
+    feed = calendar_cache.get(user_id)
+    if feed is MISSING:
+        # a miss usually follows a signup change or a reset link, so skip the
+        # lagging replica
+        read_from_primary.set(True)
 
-    return render_template("partials/profile_signups.html", signups=signups)
+        current_version = get_calendar_feed_version(user_id)
+        if current_version != version:
+            return make_response("", 404)
+
+        signups = get_user_signups(user_id)
+        feed = render_feed(user_id, version, signups, request.url_root)
+        calendar_cache.set(user_id, feed)
+
+    # a link from before the last reset, resetting drops the cached feed
+    if feed["version"] != version:
+        return make_response("", 404)
+
+    response = make_response(feed["body"])
+    response.mimetype = "text/calendar"
+    response.set_etag(feed["etag"])
+    response.last_modified = datetime.fromtimestamp(feed["last_modified"], timezone.utc)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+
+    # answers 304 when the client already has this version of the feed
+    return response.make_conditional(request)
+
+
+@app.route("/profile/tabs/history", methods=["GET"])
+@login_required
+@query_budget(1)
+def profile_history():
+    user_id = session["user_id"]
+    page = max(request.args.get("page", 1, type=int), 1)
+    offset = (page - 1) * HISTORY_PAGE_SIZE
+
+    # one extra row tells whether there is a next page
+    signups = get_user_signup_history(user_id, HISTORY_PAGE_SIZE + 1, offset)
+
+    return render_template(
+        "partials/profile_history.html",
+        signups=signups[:HISTORY_PAGE_SIZE],
+        has_more=len(signups) > HISTORY_PAGE_SIZE,
+        page=page,
+    )
 
 
 @app.route("/profile/tabs/organizations", methods=["GET"])
 @login_required
+@query_budget(1)
 def profile_orgs():
     user_id = session.get("user_id")
     organizations = get_all_user_orgs(user_id)
@@ -334,6 +621,7 @@ def dashboard():
 
 @app.route("/dashboard/tabs/opportunities", methods=["GET"])
 @login_required
+@query_budget(1)
 def dashboard_opportunities():
     opportunities = get_all_current_opportunities()
     categories = list(
@@ -353,19 +641,63 @@ def dashboard_opportunities():
     )
 
 
+@app.route("/dashboard/tabs/recommended", methods=["GET"])
+@login_required
+@query_budget(2)
+def dashboard_recommended():
+    user_id = session["user_id"]
+    page = max(request.args.get("page", 1, type=int), 1)
+    offset = (page - 1) * RECOMMENDATIONS_PAGE_SIZE
+
+    # one extra row tells whether there is a next page
+    opportunities = get_recommended_opportunities(
+        user_id, RECOMMENDATIONS_PAGE_SIZE + 1, offset
+    )
+
+    # nothing precomputed for this user yet, show what is popular instead
+    popular = page == 1 and not opportunities
+    if popular:
+        opportunities = get_popular_opportunities(
+            user_id, RECOMMENDATIONS_PAGE_SIZE + 1, offset
+        )
+
+    return render_template(
+        "partials/dashboard_recommended.html",
+        opportunities=opportunities[:RECOMMENDATIONS_PAGE_SIZE],
+        has_more=len(opportunities) > RECOMMENDATIONS_PAGE_SIZE and not popular,
+        popular=popular,
+        page=page,
+    )
+
+
 @app.route("/dashboard/tabs/organizations", methods=["GET"])
 @login_required
+@limit_concurrency("dashboard_orgs", 8)
+@query_budget(2)
 def dashboard_organizations():
     user_id = session.get("user_id")
-    user_organizations = get_all_user_orgs(user_id)
-    other_organizations = get_all_non_user_orgs(user_id)
-
-    print(other_organizations)
+    search = request.args.get("q", "").strip()
+    org_type = request.args.get("org_type", "").strip()
+
+    result = get_dashboard_organizations(
+        user_id,
+        search=search or None,
+        org_type=org_type or None,
+        limit=ORGS_PAGE_SIZE,
+        after=request.args.get("after") or None,
+        before=request.args.get("before") or None,
+    )
 
     return render_template(
         "partials/dashboard_organizations.html",
-        user_orgs=user_organizations,
-        organizations=other_organizations,
+        user_orgs=result["user_orgs"],
+        organizations=result["organizations"],
+        type_counts=result["type_counts"],
+        total=result["total"],
+        has_previous=result["has_previous"],
+        has_next=result["has_next"],
+        search=search,
+        org_type=org_type,
     )
 
 
@@ -374,6 +706,7 @@ def dashboard_organizations():
 # ************************
 @app.route("/opportunity/<int:opp_id>", methods=["GET"])
 @login_required
+@query_budget(2)
 def opportunity_details(opp_id: int):
     opp_details = get_opportunity_details(opp_id)
 
@@ -383,21 +716,75 @@ def opportunity_details(opp_id: int):
     )   
 
 
+@app.route("/opportunity/<int:opp_id>/capacity/stream", methods=["GET"])
+@login_required
+@query_budget(1)
+def opportunity_capacity_stream(opp_id: int):
+    if not capacity_stream_limiter.acquire():
+        return overloaded_response()
+
+    try:
+        current_capacity = get_opportunities_capacity([opp_id])
+    except Exception:
+        capacity_stream_limiter.release()
+        raise
+
+    updates = capacity_broadcaster.subscribe(opp_id)
+    closes_at = time.monotonic() + CAPACITY_STREAM_MAX_SECONDS
+
+    def stream():
+        # how long the browser waits before reconnecting once the stream ends
+        yield "retry: 3000\n\n"
+
+        for capacity in current_capacity:
+            yield capacity_event(capacity)
+
+        while True:
+            remaining = closes_at - time.monotonic()
+            if remaining <= 0:
+                return
+
+            try:
+                yield updates.get(timeout=min(15, remaining))
+            except queue.Empty:
+                # keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+
+    def close():
+        capacity_broadcaster.unsubscribe(opp_id, updates)
+        capacity_stream_limiter.release()
+
+    response = Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # runs even when the client leaves before the stream is iterated
+    response.call_on_close(close)
+
+    return response
+
+
 # ************************
 # organization details route
 # ************************
 @app.route("/organization/<int:org_id>", methods=["GET"])
 @login_required
+@query_budget(1)
 def organization_details(org_id: int):
-    org_details = get_org_details(org_id)
-    org_opportunities = get_all_current_opportunities_for_org(org_id)
+    page = max(request.args.get("page", 1, type=int), 1)
+    offset = (page - 1) * ORG_OPPORTUNITIES_PAGE_SIZE
 
-    print(request.referrer)
+    org_details = get_org_details_page(org_id, ORG_OPPORTUNITIES_PAGE_SIZE, offset)
+    org_opportunities = org_details["opportunities"] if org_details else []
+    total = org_details["total_opportunities"] if org_details else 0
 
     return render_template(
         "organization/organization_details.html",
         org_details=org_details,
         org_opps=org_opportunities,
+        page=page,
+        has_more=offset + len(org_opportunities) < total,
     )
 
 
@@ -406,6 +793,7 @@ def organization_details(org_id: int):
 # ************************
 @app.route("/organization/create", methods=["GET", "POST"])
 @login_required
+@query_budget(1)
 def organization_create():
     if request.method == "POST":
         org_name = request.form["name"].strip()
@@ -433,13 +821,6 @@ def organization_create():
 
             return render_template("partials/flash_messages.html")
 
-        if get_org_by_name(org_name):
-            flash(
-                "An organization with this name already exists, use a different name",
-                "error",
-            )
-            return render_template("partials/flash_messages.html")
-
         if "org_image" in request.files:
             org_image = request.files["org_image"]
             try:
@@ -448,7 +829,16 @@ def organization_create():
                 flash("Error in image upload, try again", "error")
                 return render_template("partials/flash_messages.html")
 
-        create_new_org(org_name, org_type, org_email, org_image_url, org_rep_id)
+        # the unique name constraint rejects names that are already taken
+        try:
+            create_new_org(org_name, org_type, org_email, org_image_url, org_rep_id)
+        except UniqueViolation:
+            delete_uploaded_image(org_image_url)
+            flash(
+                "An organization with this name already exists, use a different name",
+                "error",
+            )
+            return render_template("partials/flash_messages.html")
 
         if request.headers.get("HX-Request"):
             response = make_response("")
@@ -472,6 +862,7 @@ def organization_create():
 @app.route("/organization/<int:org_id>/update", methods=["GET", "POST"])
 @login_required
 @is_representative
+@query_budget(4)
 def organization_update(org_id: int):
     org_details = get_org_details(org_id)
 
@@ -517,13 +908,6 @@ def organization_update(org_id: int):
 
             return render_template("partials/flash_messages.html")
 
-        if get_org_by_name(org_name) and org_name != org_details["org_name"]:
-            flash(
-                "An organization with this name already exists, use a different name",
-                "error",
-            )
-            return render_template("partials/flash_messages.html")
-
         if "org_image" in request.files:
             org_image = request.files["org_image"]
             try:
@@ -543,7 +927,17 @@ def organization_update(org_id: int):
             flash("You have not made any changes", "warning")
             return render_template("partials/flash_messages.html")
 
-        update_org(org_name, org_type, org_email, org_image_url, org_id)
+        try:
+            update_org(org_name, org_type, org_email, org_image_url, org_id)
+        except UniqueViolation:
+            # only the image uploaded with this request, not the current one
+            if "org_image" in request.files:
+                delete_uploaded_image(org_image_url)
+            flash(
+                "An organization with this name already exists, use a different name",
+                "error",
+            )
+            return render_template("partials/flash_messages.html")
 
         if request.headers.get("HX-Request"):
             response = make_response("")
@@ -569,6 +963,7 @@ def organization_update(org_id: int):
 @app.route("/organization/<int:org_id>/delete-confirm", methods=["GET"])
 @login_required
 @is_representative
+@query_budget(3)
 def organization_delete_confirmation(org_id: int):
     org_details = get_org_details(org_id)
 
@@ -597,6 +992,7 @@ def organization_delete_confirmation(org_id: int):
 @app.delete("/organization/<int:org_id>/delete")
 @login_required
 @is_representative
+@query_budget(4)
 def organization_delete(org_id: int):
     org_details = get_org_details(org_id)
 
@@ -639,6 +1035,7 @@ def organization_delete(org_id: int):
 @app.route("/organization/<int:org_id>/manage", methods=["GET"])
 @login_required
 @is_representative
+@query_budget(3)
 def organization_manage(org_id: int):
     org_details = get_org_details(org_id)
 
@@ -651,13 +1048,11 @@ def organization_manage(org_id: int):
 @app.route("/organization/<int:org_id>/manage/opportunities", methods=["GET"])
 @login_required
 @is_representative
+@query_budget(3)
 def organization_manage_opportunities(org_id: int):
+    # each opportunity already carries its total_signups
     org_opportunities = get_all_current_opportunities_for_org(org_id)
 
-    for opp in org_opportunities:
-        total_signups = get_signup_count_for_opp(opp["opp_id"])
-        opp["total_signups"] = total_signups
-
     return render_template(
         "partials/org_manage_opportunities.html",
         org_opps=org_opportunities,
@@ -668,49 +1063,120 @@ def organization_manage_opportunities(org_id: int):
 @app.route("/organization/<int:org_id>/manage/signups", methods=["GET"])
 @login_required
 @is_representative
+@limit_concurrency("manage_signups", 4)
+@query_budget(4)
 def organization_manage_signups(org_id: int):
-    signups = get_all_signups_for_org(org_id)
-
-    # group by opportunities
-    opportunities = {}
-    for s in signups:
-        opp_id = s["opp_id"]
-
-        if opp_id not in opportunities:
-            opportunities[opp_id] = {
-                "opp_id": opp_id,
-                "title": s["title"],
-                "start_date": s["start_date"],
-                "end_date": s["end_date"],
-                "signups": [],
-            }
+    # signups come back grouped per opportunity, one page of signups each
+    opportunities = get_all_signups_for_org(org_id, signups_limit=SIGNUPS_PAGE_SIZE)
 
-        if s["signup_id"] is not None:
-            opportunities[opp_id]["signups"].append(
-                {
-                    "signup_id": s["signup_id"],
-                    "signup_date": s["signup_date"],
-                    "status": s["status"],
-                    "user": {
-                        "user_id": s["user_id"],
-                        "first_name": s["first_name"],
-                        "last_name": s["last_name"],
-                        "email": s["email"],
-                    },
-                }
-            )
+    return render_template(
+        "partials/org_manage_signups.html",
+        opportunities=opportunities,
+        org_id=org_id,
+        page_size=SIGNUPS_PAGE_SIZE,
+    )
+
+
+@app.route(
+    "/organization/<int:org_id>/manage/signups/<int:opp_id>", methods=["GET"]
+)
+@login_required
+@is_representative
+@limit_concurrency("manage_signups", 4)
+@query_budget(4)
+def organization_manage_signups_page(org_id: int, opp_id: int):
+    offset = request.args.get("offset", 0, type=int)
+    if offset < 0:
+        offset = 0
+
+    opportunities = get_all_signups_for_org(
+        org_id, signups_limit=SIGNUPS_PAGE_SIZE, signups_offset=offset, opp_id=opp_id
+    )
+
+    if not opportunities:
+        return ""
 
     return render_template(
-        "partials/org_manage_signups.html", opportunities=opportunities.values()
+        "partials/org_manage_signups_page.html",
+        opp=opportunities[0],
+        org_id=org_id,
+        offset=offset,
+        page_size=SIGNUPS_PAGE_SIZE,
     )
 
 
+@app.route("/organization/<int:org_id>/manage/signups/status", methods=["POST"])
+@login_required
+@is_representative
+@query_budget(3)
+def organization_update_signups_status(org_id: int):
+    status = request.form.get("status", "").strip().lower()
+    signup_ids = [
+        int(signup_id)
+        for signup_id in request.form.getlist("signup_ids")
+        if signup_id.isdigit()
+    ]
+
+    error = None
+    if not signup_ids:
+        error = "Please select at least one signup"
+    elif not validate_signup_status(status):
+        error = "Please pick a valid status"
+
+    if error:
+        response = make_response("")
+        response.headers["HX-Trigger"] = json.dumps(
+            {
+                "showToast": {
+                    "message": error,
+                    "type": "error",
+                    "fromHTMX": True,
+                }
+            }
+        )
+        return response
+
+    # a single statement updates every selected signup that belongs to this org
+    updated_signups = update_signup_status_for_org(org_id, signup_ids, status)
+
+    signups = [
+        {
+            "signup_id": s["signup_id"],
+            "signup_date": s["signup_date"],
+            "status": s["status"],
+            "user": {
+                "user_id": s["user_id"],
+                "first_name": s["first_name"],
+                "last_name": s["last_name"],
+                "email": s["email"],
+            },
+        }
+        for s in updated_signups
+    ]
+
+    # only the changed rows are sent back and swapped out of band
+    response = make_response(
+        render_template("partials/org_manage_signup_rows_oob.html", signups=signups)
+    )
+    response.headers["HX-Trigger"] = json.dumps(
+        {
+            "showToast": {
+                "message": f"{len(signups)} {'signup' if len(signups) == 1 else 'signups'} marked as {status}",
+                "type": "success",
+                "fromHTMX": True,
+            }
+        }
+    )
+    return response
+
+
 # ************************
 # opportunity management routes
 # ************************
 @app.route("/organization/<int:org_id>/add-opportunity", methods=["GET", "POST"])
 @login_required
 @is_representative
+@query_budget(3)
 def opportunity_create(org_id: int):
     if request.method == "POST":
         opp_title = request.form["title"].strip()
@@ -776,14 +1242,6 @@ def opportunity_create(org_id: int):
                 )
                 return render_template("partials/flash_messages.html")
 
-        # check if opportunity already exists
-        if get_opportunity_for_org_by_title(org_id, opp_title):
-            flash(
-                "An opportunity with this name already exists, use a different name",
-                "error",
-            )
-            return render_template("partials/flash_messages.html")
-
         if "flyer" in request.files:
             opp_image = request.files["flyer"]
             try:
@@ -800,17 +1258,26 @@ def opportunity_create(org_id: int):
         else:
             opp_max_signups = int(opp_max_signups)
 
-        # create the new opportunity
-        create_new_opportunity(
-            opp_title,
-            opp_image_url,
-            opp_description,
-            opp_category,
-            opp_start_date,
-            opp_end_date,
-            opp_max_signups,
-            org_id,
-        )
+        # create the new opportunity, the unique title constraint rejects
+        # titles the org already uses
+        try:
+            create_new_opportunity(
+                opp_title,
+                opp_image_url,
+                opp_description,
+                opp_category,
+                opp_start_date,
+                opp_end_date,
+                opp_max_signups,
+                org_id,
+            )
+        except UniqueViolation:
+            delete_uploaded_image(opp_image_url)
+            flash(
+                "An opportunity with this name already exists, use a different name",
+                "error",
+            )
+            return render_template("partials/flash_messages.html")
 
         if request.headers.get("HX-Request"):
             response = make_response("")
@@ -833,8 +1300,79 @@ def opportunity_create(org_id: int):
     return render_template("opportunity/opportunity_add.html", org_id=org_id)
 
 
+@app.route("/organization/<int:org_id>/import-opportunities", methods=["GET", "POST"])
+@login_required
+@is_representative
+@limit_concurrency("opportunity_import", 2)
+@query_budget(6)
+def opportunity_import(org_id: int):
+    if request.method == "POST":
+        if "csv_file" not in request.files or request.files["csv_file"].filename == "":
+            flash("Please provide a CSV file to import", "error")
+            return render_template("partials/flash_messages.html")
+
+        # validate every row before touching the db
+        opportunities, errors = parse_opportunity_csv(request.files["csv_file"])
+
+        # check all titles against the org's existing opportunities in one query
+        existing_titles = set()
+        if opportunities:
+            existing_titles = get_existing_opportunity_titles_for_org(
+                org_id, [opp["title"] for opp in opportunities]
+            )
+
+        for opp in opportunities:
+            if opp["title"] in existing_titles:
+                errors.append(
+                    {
+                        "row": opp["row"],
+                        "messages": [
+                            "An opportunity with this name already exists, use a different name"
+                        ],
+                    }
+                )
+
+        if errors:
+            errors.sort(key=lambda e: e["row"] or 0)
+            return render_template(
+                "partials/opportunity_import_report.html", errors=errors
+            )
+
+        # insert all the opportunities in a single transaction. a title taken
+        # since the check above rolls back the whole import
+        try:
+            imported_count = create_new_opportunities_bulk(opportunities, org_id)
+        except UniqueViolation:
+            flash(
+                "An opportunity with this name already exists, use a different name",
+                "error",
+            )
+            return render_template("partials/flash_messages.html")
+
+        if request.headers.get("HX-Request"):
+            response = make_response("")
+            response.headers["HX-Trigger"] = json.dumps(
+                {
+                    "showToast": {
+                        "message": f"{imported_count} opportunities imported successfully",
+                        "type": "success",
+                    }
+                }
+            )
+            response.headers["HX-Redirect"] = url_for(
+                "organization_manage", org_id=org_id
+            )
+            return response
+
+        flash(f"{imported_count} opportunities imported successfully", "success")
+        return redirect(url_for("organization_manage", org_id=org_id))
+
+    return render_template("opportunity/opportunity_import.html", org_id=org_id)
+
+
 @app.route("/organization/<int:opp_id>/update-opportunity", methods=["GET", "POST"])
 @login_required
+@query_budget(3)
 def opportunity_update(opp_id: int):
     opp_details = get_opportunity_details(opp_id)
     user_id = session["user_id"]
@@ -937,17 +1475,6 @@ def opportunity_update(opp_id: int):
                 )
                 return render_template("partials/flash_messages.html")
 
-        # check if opportunity already exists
-        if (
-                get_opportunity_for_org_by_title(opp_details["org_id"], opp_title)
-                and opp_title != opp_details["title"]
-        ):
-            flash(
-                "An opportunity with this name already exists, use a different name",
-                "error",
-            )
-            return render_template("partials/flash_messages.html")
-
         if "flyer" in request.files:
             opp_image = request.files["flyer"]
             try:
@@ -978,16 +1505,26 @@ def opportunity_update(opp_id: int):
             flash("You have not made any changes", "warning")
             return render_template("partials/flash_messages.html")
 
-        update_opp(
-            opp_title,
-            opp_image_url,
-            opp_description,
-            opp_category,
-            opp_start_date,
-            opp_end_date,
-            opp_max_signups,
-            opp_id,
-        )
+        try:
+            update_opp(
+                opp_title,
+                opp_image_url,
+                opp_description,
+                opp_category,
+                opp_start_date,
+                opp_end_date,
+                opp_max_signups,
+                opp_id,
+            )
+        except UniqueViolation:
+            # only the image uploaded with this request, not the current one
+            if "flyer" in request.files:
+                delete_uploaded_image(opp_image_url)
+            flash(
+                "An opportunity with this name already exists, use a different name",
+                "error",
+            )
+            return render_template("partials/flash_messages.html")
 
         if request.headers.get("HX-Request"):
             response = make_response("")
@@ -1012,6 +1549,7 @@ def opportunity_update(opp_id: int):
 
 @app.route("/opportunity/<int:opp_id>/delete-confirm", methods=["GET"])
 @login_required
+@query_budget(2)
 def opportunity_delete_confirmation(opp_id: int):
     opp_details = get_opportunity_details(opp_id)
     user_id = session["user_id"]
@@ -1057,6 +1595,7 @@ def opportunity_delete_confirmation(opp_id: int):
 
 @app.delete("/opportunity/<int:opp_id>/delete")
 @login_required
+@query_budget(3)
 def opportunity_delete(opp_id: int):
     opp_details = get_opportunity_details(opp_id)
     user_id = session["user_id"]
@@ -1116,24 +1655,54 @@ def opportunity_delete(opp_id: int):
     return redirect(url_for("organization_manage", org_id=opp_details["org_id"]))
 
 
+def signup_outcome_response(outcome: str, opp_id: int):
+    if outcome == "already_registered":
+        template = "partials/signup/already_registered.html"
+        message = "You have already registered for this opportunity"
+        category = "warning"
+    elif outcome == "full":
+        template = "partials/signup/full_capacity.html"
+        message = "Cannot signup, this opportunity has reached its maximum signup capacity"
+        category = "error"
+    else:
+        template = "partials/signup/success.html"
+        message = "Signed up successfully"
+        category = "success"
+
+    if request.headers.get("HX-Request"):
+        response = make_response(render_template(template))
+        response.headers["HX-Trigger"] = json.dumps(
+            {
+                "showToast": {
+                    "message": message,
+                    "type": category,
+                    "fromHTMX": True,
+                }
+            }
+        )
+        return response
+
+    flash(message, category)
+    return redirect(url_for("opportunity_details", opp_id=opp_id))
+
+
 @app.route("/signup/<int:opp_id>", methods=["POST"])
 @login_required
+@query_budget(8)
 def signup(opp_id: int):
     user_id = session["user_id"]
 
-    if not get_opportunity_details(opp_id):
-        flash("That opportunity does not exist", "error")
-        return redirect(url_for("dashboard"))
+    # queued mode, the worker applies the same checks when it inserts the batch
+    if SIGNUP_QUEUE_ENABLED:
+        ticket = signup_queue.enqueue(user_id, opp_id)
 
-    if get_signup_by_user_and_opp(user_id, opp_id):
-        if request.headers.get("HX-Request"):
-            response = make_response(
-                render_template("partials/signup/already_registered.html")
-            )
+        if not ticket:
+            response = make_response("", 503)
+            response.headers["Retry-After"] = "2"
             response.headers["HX-Trigger"] = json.dumps(
                 {
                     "showToast": {
-                        "message": "You have already registered for this opportunity",
+                        "message": "We are receiving a lot of signups right now, please try again in a moment",
                         "type": "warning",
                         "fromHTMX": True,
                     }
@@ -1141,58 +1710,111 @@ def signup(opp_id: int):
             )
             return response
 
-        flash("You have already registered for this opportunity", "warning")
+        if request.headers.get("HX-Request"):
+            return render_template("partials/signup/pending.html", ticket=ticket)
+
+        flash("Your signup is being processed", "success")
         return redirect(url_for("opportunity_details", opp_id=opp_id))
 
+    if not get_opportunity_details(opp_id):
+        flash("That opportunity does not exist", "error")
+        return redirect(url_for("dashboard"))
+
+    if get_signup_by_user_and_opp(user_id, opp_id):
+        return signup_outcome_response("already_registered", opp_id)
+
     signup_count = get_signup_count_for_opp(opp_id)
     max_signup_count = get_max_signups(opp_id)
 
-    if max_signup_count and signup_count == max_signup_count:
-        if request.headers.get("HX-Request"):
-            response = make_response(
-                render_template("partials/signup/full_capacity.html")
-            )
-            response.headers["HX-Trigger"] = json.dumps(
-                {
-                    "showToast": {
-                        "message": "Cannot signup, this opportunity has reached its maximum signup capacity",
-                        "type": "error",
-                        "fromHTMX": True,
-                    }
-                }
-            )
-            return response
+    if max_signup_count and signup_count >= max_signup_count:
+        return signup_outcome_response("full", opp_id)
+
+    # repeats both checks atomically, for signups racing past the ones above
+    outcome = create_new_signup(user_id, opp_id)
+
+    return signup_outcome_response(outcome, opp_id)
+
+
+@app.route("/signup/status/<ticket>", methods=["GET"])
+@login_required
+def signup_status(ticket: str):
+    result = signup_queue.get_result(ticket)
 
-        flash(
-            "Cannot signup, this opportunity has reached its maximum signup capacity",
-            "error",
+    if not result or result["user_id"] != session["user_id"]:
+        response = make_response("")
+        response.headers["HX-Trigger"] = json.dumps(
+            {
+                "showToast": {
+                    "message": "We could not find your signup request, please try again",
+                    "type": "error",
+                }
+            }
         )
-        return redirect(url_for("opportunity_details", opp_id=opp_id))
+        response.headers["HX-Refresh"] = "true"
+        return response
 
-    create_new_signup(user_id, opp_id)
+    if result["status"] == "pending":
+        return render_template("partials/signup/pending.html", ticket=ticket)
 
-    if request.headers.get("HX-Request"):
-        response = make_response(render_template("partials/signup/success.html"))
+    if result["status"] == "not_found":
+        response = make_response("")
         response.headers["HX-Trigger"] = json.dumps(
             {
                 "showToast": {
-                    "message": "Signed up successfully",
-                    "type": "success",
-                    "fromHTMX": True,
+                    "message": "That opportunity does not exist",
+                    "type": "error",
                 }
             }
         )
+        response.headers["HX-Redirect"] = url_for("dashboard")
         return response
 
-    flash("Signed up successfully", "success")
-    return redirect(url_for("opportunity_details", opp_id=opp_id))
+    if result["status"] == "error":
+        response = make_response("")
+        response.headers["HX-Trigger"] = json.dumps(
+            {
+                "showToast": {
+                    "message": "Something went wrong with your signup, please try again",
+                    "type": "error",
+                }
+            }
+        )
+        response.headers["HX-Refresh"] = "true"
+        return response
+
+    return signup_outcome_response(result["status"], result["opp_id"])
 
 
 @app.route("/signup/<int:signup_id>/delete", methods=["POST"])
 @login_required
-@is_authorized_to_delete_signup
+@query_budget(1)
 def signup_delete(signup_id: int):
-    delete_user_signup(signup_id)
+    user_id = session["user_id"]
+
+    # checks the user may delete the signup and deletes it in one statement
+    result = delete_user_signup(signup_id, user_id)
+
+    if result != "deleted":
+        if result == "not_found":
+            message = "Invalid Signup ID"
+        else:
+            message = "You are not authorized to make this request"
+
+        if request.headers.get("HX-Request"):
+            response = make_response("")
+            response.headers["HX-Trigger"] = json.dumps(
+                {
+                    "showToast": {
+                        "message": message,
+                        "type": "error",
+                    }
+                }
+            )
+            response.headers["HX-Redirect"] = url_for("dashboard")
+            return response
+
+        flash(message, "error")
+        return redirect(url_for("dashboard"))
 
     if request.headers.get("HX-Request"):
         response = make_response("")
@@ -1211,5 +1833,170 @@ def signup_delete(signup_id: int):
     return redirect(url_for("profile"))
 
 
+# ************************
+# health routes
+# ************************
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    return {"status": "ok"}
+
+
+@app.route("/readyz", methods=["GET"])
+@query_budget(4)
+def readyz():
+    stats = pool_stats()
+    ping_errors = ping_database()
+
+    reasons = []
+    for name, error in ping_errors.items():
+        if error:
+            reasons.append(f"{name} database unreachable: {error}")
+
+    for name, pool_state in stats.items():
+        if pool_state["saturation"] >= READY_POOL_SATURATION:
+            reasons.append(f"{name} pool saturated")
+
+        since_refused = pool_state["seconds_since_refused"]
+        if since_refused is not None and since_refused < READY_REFUSED_WINDOW:
+            reasons.append(f"{name} pool refused a connection {since_refused}s ago")
+
+    ready = not reasons
+    return {"ready": ready, "reasons": reasons, "pools": stats}, 200 if ready else 503
+
+
+# ************************
+# metrics routes
+# ************************
+@app.route("/metrics/auth-cache", methods=["GET"])
+def auth_cache_metrics():
+    metrics_token = os.getenv("METRICS_TOKEN")
+
+    # only served to callers presenting the configured token
+    if not metrics_token or request.headers.get("X-Metrics-Token") != metrics_token:
+        return make_response("", 404)
+
+    return {"representative": representative_cache.stats()}
+
+
+# ************************
+# maintenance commands
+# ************************
+def precompile_templates() -> int:
+    names = app.jinja_env.list_templates(extensions=["html"])
+    for name in names:
+        app.jinja_env.get_template(name)
+
+    return len(names)
+
+
+@app.cli.command("precompile-templates")
+def precompile_templates_command():
+    count = precompile_templates()
+    click.echo(f"compiled {count} templates into {JINJA_CACHE_DIR}")
+
+
+@app.cli.command("profile-token")
+def profile_token_command():
+    click.echo(make_profile_token(app.secret_key))
+    click.echo(
+        f"send it as the {PROFILE_HEADER} header, valid for {PROFILER_TOKEN_MAX_AGE}s"
+    )
+
+
+@app.cli.command("refresh-recommendations")
+@click.option(
+    "--per-user", default=50, show_default=True, help="Recommendations kept per user."
+)
+@click.option(
+    "--batch-size",
+    default=500,
+    show_default=True,
+    help="Users refreshed per transaction.",
+)
+@click.option(
+    "--pause",
+    default=0.1,
+    show_default=True,
+    help="Seconds to wait between batches.",
+)
+def refresh_recommendations_command(per_user: int, batch_size: int, pause: float):
+    # every batch replaces only its own users' rows in its own transaction
+    user_total = row_total = 0
+    after_user_id = 0
+    while True:
+        after_user_id, user_count, row_count = refresh_recommendations(
+            after_user_id, batch_size, per_user=per_user
+        )
+        if after_user_id is None:
+            break
+
+        user_total += user_count
+        row_total += row_count
+        time.sleep(pause)
+
+    click.echo(f"stored {row_total} recommendations for {user_total} users")
+
+
+@app.cli.command("archive-opportunities")
+@click.option(
+    "--older-than-days",
+    default=30,
+    show_default=True,
+    help="Archive opportunities that ended at least this many days ago.",
+)
+@click.option(
+    "--batch-size",
+    default=500,
+    show_default=True,
+    help="Opportunities moved per transaction.",
+)
+@click.option(
+    "--pause",
+    default=0.1,
+    show_default=True,
+    help="Seconds to wait between batches.",
+)
+def archive_opportunities_command(older_than_days: int, batch_size: int, pause: float):
+    ended_before = datetime.now().date() - timedelta(days=older_than_days)
+
+    # small transactions keep row locks and replication lag short
+    opp_total = signup_total = 0
+    while True:
+        opp_count, signup_count = archive_ended_opportunities(ended_before, batch_size)
+        opp_total += opp_count
+        signup_total += signup_count
+
+        if opp_count < batch_size:
+            break
+
+        time.sleep(pause)
+
+    click.echo(
+        f"archived {opp_total} opportunities and {signup_total} signups that ended before {ended_before}"
+    )
+
+
+@app.cli.command("reconcile-signup-counts")
+@click.option(
+    "--dry-run", is_flag=True, help="Only report the drift, do not repair it."
+)
+def reconcile_signup_counts_command(dry_run: bool):
+    drifted = reconcile_signup_counts(repair=not dry_run)
+
+    for row in drifted:
+        click.echo(
+            f"opportunity {row['opp_id']}: stored {row['stored_count']}, actual {row['actual_count']}"
+        )
+
+    if dry_run:
+        click.echo(f"{len(drifted)} opportunities have drifted signup counts")
+    else:
+        click.echo(f"repaired {len(drifted)} opportunities")
+
+
+# load every template up front so the first request to each page is not slower
+if PRODUCTION:
+    precompile_templates()
+
 if __name__ == "__main__":
-    app.run(debug=True)
+    app.run(debug=not PRODUCTION)
@@ -0,0 +1,119 @@
+# measures the planning time saved by the prepared hot statements
+#
+#   python -m benchmarks.prepared_statements [iterations]
+#
+# needs a DATABASE_URL with some data in it. every iteration runs the hot
+# statements of one typical request, once as plain queries and once through
+# EXECUTE on statements prepared by db/prepared.py
+import os
+import sys
+import time
+
+import psycopg2
+from dotenv import load_dotenv
+
+import db.queries  # registers the hot statements
+from db.connection import PreparingConnection
+from db.prepared import PREPARED_STATEMENTS, execute_prepared
+
+load_dotenv()
+
+
+def sample_params(cur):
+    cur.execute(
+        """
+        SELECT sup.user_id, sup.opp_id, opp.org_id, org.org_rep_id
+        FROM signup AS sup,
+             opportunities AS opp,
+             organizations AS org
+        WHERE sup.opp_id = opp.opp_id
+          AND opp.org_id = org.org_id
+        LIMIT 1
+        """
+    )
+    row = cur.fetchone()
+    if not row:
+        sys.exit("the database needs at least one signup to run this benchmark")
+
+    user_id, opp_id, org_id, org_rep_id = row
+
+    return {
+        "get_user_by_id": (user_id,),
+        "get_opportunity_details": (opp_id,),
+        "check_is_representative": (org_id, org_rep_id),
+        "get_signup_by_user_and_opp": (user_id, opp_id),
+        "get_signup_count_for_opp": (opp_id,),
+    }
+
+
+def plain_sql(sql: str, param_count: int):
+    for i in range(param_count, 0, -1):
+        sql = sql.replace(f"${i}", "%s")
+
+    return sql
+
+
+def run_plain(cur, params: dict, iterations: int):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for name, args in params.items():
+            cur.execute(plain_sql(PREPARED_STATEMENTS[name], len(args)), args)
+            cur.fetchall()
+
+    return time.perf_counter() - start
+
+
+def run_prepared(cur, params: dict, iterations: int):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for name, args in params.items():
+            execute_prepared(cur, name, args)
+            cur.fetchall()
+
+    return time.perf_counter() - start
+
+
+def planning_time(cur, sql: str) -> float:
+    cur.execute("EXPLAIN (ANALYZE, SUMMARY, FORMAT JSON) " + sql)
+    return cur.fetchone()[0][0]["Planning Time"]
+
+
+if __name__ == "__main__":
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        sys.exit("set DATABASE_URL to run this benchmark")
+
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    conn = psycopg2.connect(database_url, connection_factory=PreparingConnection)
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    params = sample_params(cur)
+
+    # warm up both paths, this also prepares the statements
+    run_plain(cur, params, 10)
+    run_prepared(cur, params, 10)
+
+    plain = run_plain(cur, params, iterations)
+    prepared = run_prepared(cur, params, iterations)
+
+    print(f"{iterations} requests, {len(params)} hot statements each")
+    print(f"plain     {plain * 1000:>9.1f} ms {plain / iterations * 1e6:>8.1f} us/request")
+    print(
+        f"prepared  {prepared * 1000:>9.1f} ms {prepared / iterations * 1e6:>8.1f} us/request"
+    )
+    print(f"saved     {(plain - prepared) / iterations * 1e6:>8.1f} us/request")
+
+    print()
+    print("planning time per statement when not prepared")
+    total = 0
+    for name, args in params.items():
+        sql = cur.mogrify(plain_sql(PREPARED_STATEMENTS[name], len(args)), args)
+        plan_ms = planning_time(cur, sql.decode("utf-8"))
+        total += plan_ms
+        print(f"{name:<28} {plan_ms:>7.3f} ms")
+    print(f"{'total per request':<28} {total:>7.3f} ms")
+
+    cur.close()
+    conn.close()
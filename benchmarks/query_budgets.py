@@ -0,0 +1,144 @@
+# checks every page against its query budget and for N+1 patterns
+#
+#   python -m benchmarks.query_budgets
+#
+# needs a DATABASE_URL with some data in it. the pages are requested through
+# the flask test client with QUERY_BUDGET_MODE=strict, once for the
+# organization with the fewest signups and once for the one with the most.
+# a page fails when it runs over its budget, repeats a statement, or runs
+# more queries for the big organization than for the small one. exits
+# non-zero on any failure so it can gate a deploy
+import os
+import sys
+
+os.environ["QUERY_BUDGET_MODE"] = "strict"
+
+from dotenv import load_dotenv
+from flask import url_for
+
+load_dotenv()
+
+if not os.getenv("DATABASE_URL"):
+    sys.exit("set DATABASE_URL to run this benchmark")
+
+from app import app  # noqa: E402
+from db.connection import get_conn, put_conn  # noqa: E402
+from db.query_counter import query_log  # noqa: E402
+from utils.query_budget import QueryBudgetExceeded, statement_text  # noqa: E402
+
+PAGES = [
+    ("profile", {}),
+    ("profile_signups", {}),
+    ("profile_orgs", {}),
+    ("dashboard_opportunities", {}),
+    ("dashboard_organizations", {}),
+    ("organization_details", {"org_id"}),
+    ("organization_manage", {"org_id"}),
+    ("organization_manage_opportunities", {"org_id"}),
+    ("organization_manage_signups", {"org_id"}),
+    ("organization_manage_signups_page", {"org_id", "opp_id"}),
+    ("organization_delete_confirmation", {"org_id"}),
+    ("opportunity_details", {"opp_id"}),
+    ("opportunity_delete_confirmation", {"opp_id"}),
+]
+
+
+def sample_orgs():
+    conn = get_conn()
+    cur = conn.cursor()
+
+    cur.execute(
+        """
+        SELECT org.org_id,
+               org.org_rep_id,
+               MIN(opp.opp_id)                  AS opp_id,
+               COALESCE(SUM(opp.signup_count), 0) AS signups
+        FROM organizations AS org,
+             opportunities AS opp
+        WHERE opp.org_id = org.org_id
+        GROUP BY org.org_id, org.org_rep_id
+        ORDER BY signups
+        """
+    )
+    orgs = cur.fetchall()
+
+    cur.close()
+    put_conn(conn)
+
+    if not orgs:
+        sys.exit("the database needs at least one organization with an opportunity")
+
+    return orgs[0], orgs[-1]
+
+
+# statements that only run the first time a connection sees a prepared query
+def counted(queries: list) -> int:
+    return sum(1 for query in queries if not statement_text(query).startswith("PREPARE"))
+
+
+def run_page(client, endpoint: str, params: dict):
+    with app.test_request_context():
+        url = url_for(endpoint, **params)
+
+    try:
+        # the first request warms the authorization cache and prepared statements
+        client.get(url)
+        response = client.get(url)
+    except QueryBudgetExceeded as e:
+        return None, str(e)
+
+    if response.status_code >= 400:
+        return None, f"{endpoint} returned {response.status_code}"
+
+    return counted(query_log.get()), None
+
+
+if __name__ == "__main__":
+    app.testing = True
+
+    small, big = sample_orgs()
+    failures = []
+    counts = {}
+
+    for label, org in (("small", small), ("big", big)):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session["user_id"] = org["org_rep_id"]
+            session["name"] = "benchmark"
+
+        for endpoint, args in PAGES:
+            params = {arg: org[arg] for arg in args}
+            count, failure = run_page(client, endpoint, params)
+
+            if failure:
+                failures.append(failure)
+            else:
+                counts.setdefault(endpoint, {})[label] = count
+
+    print(
+        f"small org {small['org_id']} ({small['signups']} signups), "
+        f"big org {big['org_id']} ({big['signups']} signups)"
+    )
+    print(f"{'page':<36} {'budget':>6} {'small':>6} {'big':>6}")
+    for endpoint, _ in PAGES:
+        page_counts = counts.get(endpoint, {})
+        budget = getattr(app.view_functions[endpoint], "query_budget", 0)
+        small_count = page_counts.get("small")
+        big_count = page_counts.get("big")
+
+        print(f"{endpoint:<36} {budget:>6} {str(small_count):>6} {str(big_count):>6}")
+
+        if small_count is not None and big_count is not None and big_count > small_count:
+            failures.append(
+                f"{endpoint} ran {big_count} queries for the big organization "
+                f"and {small_count} for the small one"
+            )
+
+    if failures:
+        print()
+        for failure in failures:
+            print(f"FAIL {failure}")
+        sys.exit(1)
+
+    print()
+    print("all pages within budget")
@@ -0,0 +1,109 @@
+# compares RealDictCursor rows against the lean row types in db/rows.py
+#
+#   python -m benchmarks.row_types [row_count]
+#
+# without a DATABASE_URL the rows are decoded from in-memory tuples. with a
+# DATABASE_URL the same comparison runs against real result sets fetched
+# through both cursor types
+import os
+import sys
+import time
+import tracemalloc
+
+from dotenv import load_dotenv
+from psycopg2.extras import RealDictRow, RealDictCursor
+
+from db.rows import OrgRow, TupleCursor, fetchall_as
+
+load_dotenv()
+
+ORG_COLUMNS = list(OrgRow._fields)
+
+ORG_QUERY = """
+    SELECT g                      AS org_id,
+           'Organization ' || g   AS org_name,
+           'student_org'          AS org_type,
+           'org' || g || '@utdallas.edu' AS org_email,
+           'https://res.cloudinary.com/utd-link/image/upload/' || g || '.png' AS org_image_url,
+           g %% 500               AS org_rep_id
+    FROM generate_series(1, %s) AS g
+"""
+
+
+def measure(label: str, build, row_count: int):
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows = build()
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert len(rows) == row_count
+
+    print(
+        f"{label:<28} {elapsed * 1000:>9.1f} ms {current / 1024 / 1024:>9.2f} MiB "
+        f"{current / row_count:>7.0f} B/row"
+    )
+
+
+def bench_in_memory(row_count: int):
+    raw_rows = [
+        (
+            i,
+            f"Organization {i}",
+            "student_org",
+            f"org{i}@utdallas.edu",
+            f"https://res.cloudinary.com/utd-link/image/upload/{i}.png",
+            i % 500,
+        )
+        for i in range(row_count)
+    ]
+
+    print(f"in-memory decode of {row_count} organization rows")
+    measure(
+        "RealDictRow",
+        lambda: [RealDictRow(zip(ORG_COLUMNS, row)) for row in raw_rows],
+        row_count,
+    )
+    measure("OrgRow", lambda: list(map(OrgRow._make, raw_rows)), row_count)
+
+
+def bench_database(database_url: str, row_count: int):
+    import psycopg2
+
+    conn = psycopg2.connect(database_url)
+
+    def fetch_dicts():
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(ORG_QUERY, (row_count,))
+        rows = cur.fetchall()
+        cur.close()
+        return rows
+
+    def fetch_lean():
+        cur = conn.cursor(cursor_factory=TupleCursor)
+        cur.execute(ORG_QUERY, (row_count,))
+        rows = fetchall_as(cur, OrgRow)
+        cur.close()
+        return rows
+
+    # warm up the connection and the plan cache
+    fetch_dicts()
+    fetch_lean()
+
+    print(f"database fetch of {row_count} organization rows")
+    measure("RealDictCursor", fetch_dicts, row_count)
+    measure("TupleCursor + OrgRow", fetch_lean, row_count)
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    bench_in_memory(count)
+
+    url = os.getenv("DATABASE_URL")
+    if url:
+        print()
+        bench_database(url, count)
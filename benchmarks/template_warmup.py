@@ -0,0 +1,104 @@
+# measures what a fresh worker pays for templates on its first requests
+#
+#   python -m benchmarks.template_warmup [trials]
+#
+# every trial builds a new Flask app on the real templates folder, the way a
+# new worker starts, then times the first request to the index page and the
+# load of every template. it runs once compiling from source, once with the
+# bytecode cache already on disk and once after precompiling at startup. no
+# database is needed
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from flask import Flask, render_template
+from jinja2 import FileSystemBytecodeCache
+
+from utils.image_uploader import register_template_filters
+
+TEMPLATE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
+
+# endpoints the index page links to
+LINKED_ENDPOINTS = ["about", "privacy", "login", "logout", "dashboard", "profile"]
+
+
+def make_app(cache_dir=None):
+    app = Flask(__name__, template_folder=TEMPLATE_FOLDER)
+    app.secret_key = "benchmark"
+    app.config["TEMPLATES_AUTO_RELOAD"] = False
+
+    if cache_dir is not None:
+        app.jinja_options = {
+            **app.jinja_options,
+            "bytecode_cache": FileSystemBytecodeCache(cache_dir),
+        }
+
+    register_template_filters(app)
+
+    app.add_url_rule("/", "index", lambda: render_template("index.html"))
+    for endpoint in LINKED_ENDPOINTS:
+        app.add_url_rule(f"/{endpoint}", endpoint, lambda: "")
+
+    return app
+
+
+def load_all(app):
+    for name in app.jinja_env.list_templates(extensions=["html"]):
+        app.jinja_env.get_template(name)
+
+
+def first_request(app) -> float:
+    client = app.test_client()
+
+    start = time.perf_counter()
+    response = client.get("/")
+    elapsed = time.perf_counter() - start
+
+    assert response.status_code == 200
+    return elapsed
+
+
+def all_templates(app) -> float:
+    start = time.perf_counter()
+    load_all(app)
+    return time.perf_counter() - start
+
+
+def run(trials: int, cache_dir: str):
+    results = {"from source": ([], []), "bytecode cache": ([], []), "precompiled": ([], [])}
+
+    # fill the bytecode cache once, like the build step does
+    load_all(make_app(cache_dir))
+
+    for _ in range(trials):
+        results["from source"][0].append(first_request(make_app()))
+        results["from source"][1].append(all_templates(make_app()))
+
+        results["bytecode cache"][0].append(first_request(make_app(cache_dir)))
+        results["bytecode cache"][1].append(all_templates(make_app(cache_dir)))
+
+        app = make_app(cache_dir)
+        load_all(app)
+        results["precompiled"][0].append(first_request(app))
+        results["precompiled"][1].append(all_templates(app))
+
+    return results
+
+
+if __name__ == "__main__":
+    trials = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        results = run(trials, cache_dir)
+
+    template_count = len(make_app().jinja_env.list_templates(extensions=["html"]))
+
+    print(f"{trials} fresh apps, {template_count} templates, median of each")
+    print(f"{'':<16} {'first GET /':>12} {'all templates':>14}")
+    for name, (requests, loads) in results.items():
+        print(
+            f"{name:<16} {statistics.median(requests) * 1000:>9.2f} ms "
+            f"{statistics.median(loads) * 1000:>11.2f} ms"
+        )
@@ -1,19 +1,208 @@
+import atexit
 import os
+import time
+from contextvars import ContextVar
 
 from dotenv import load_dotenv
-from psycopg2.extras import RealDictCursor
-from psycopg2.pool import SimpleConnectionPool
+from psycopg2.extensions import connection
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+from .query_counter import CountingDictCursor
 
 load_dotenv()
 
+# postgres: the server in DATABASE_URL. embedded: a throwaway local postgres
+# started for this process, see db/embedded.py
+DATABASE_BACKEND = os.getenv("DATABASE_BACKEND", "postgres").lower()
+
 database_url = os.getenv("DATABASE_URL")
+replica_database_url = os.getenv("DATABASE_REPLICA_URL")
+
+embedded_postgres = None
+if DATABASE_BACKEND == "embedded":
+    from .embedded import EmbeddedPostgres
+
+    embedded_postgres = EmbeddedPostgres().start()
+    atexit.register(embedded_postgres.stop)
+
+    database_url = embedded_postgres.create_database()
+    replica_database_url = None
+
+# set per request by the app. reads go to the primary while this is true, so a
+# user who just changed something reads their own writes
+read_from_primary = ContextVar("read_from_primary", default=False)
+
+# set whenever a write connection is handed out during the current request
+wrote_to_primary = ContextVar("wrote_to_primary", default=False)
+
+# connections handed out during the current request, so the ones a failed or
+# cancelled query never returned can be put back when the request ends
+checked_out = ContextVar("checked_out", default=None)
+
+# statement_timeout in milliseconds for each class of query, 0 means no limit.
+# everything runs under "default" unless the query function asks for another one
+STATEMENT_TIMEOUTS = {
+    "default": int(os.getenv("STATEMENT_TIMEOUT_MS", "2000")),
+    "heavy": int(os.getenv("HEAVY_STATEMENT_TIMEOUT_MS", "10000")),
+    "maintenance": int(os.getenv("MAINTENANCE_STATEMENT_TIMEOUT_MS", "0")),
+    "ping": int(os.getenv("PING_STATEMENT_TIMEOUT_MS", "1000")),
+}
+
+
+# keeps track of the server-side prepared statements of each pooled connection
+class PreparingConnection(connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+        self.from_replica = False
+
+
+# threaded, since the signup queue worker and the capacity listener take
+# connections from their own threads next to the request threads
+def make_pool(dsn: str) -> ThreadedConnectionPool:
+    return ThreadedConnectionPool(
+        1,
+        10,
+        dsn,
+        cursor_factory=CountingDictCursor,
+        connection_factory=PreparingConnection,
+        options=f"-c statement_timeout={STATEMENT_TIMEOUTS['default']}",
+    )
+
+
+pool = make_pool(database_url)
+replica_pool = make_pool(replica_database_url) if replica_database_url else None
+
+
+# points the pools at another database, e.g. a fresh embedded one per test.
+# the caches are emptied since their entries came from the old database, and
+# the capacity broadcaster follows database_url on its own
+def use_database(dsn: str, replica_dsn: str = None):
+    global pool, replica_pool, database_url, replica_database_url
+
+    pool.closeall()
+    if replica_pool is not None:
+        replica_pool.closeall()
+
+    database_url = dsn
+    replica_database_url = replica_dsn
+    pool = make_pool(dsn)
+    replica_pool = make_pool(replica_dsn) if replica_dsn else None
+
+    # imported here so .env is loaded before utils.cache reads its settings
+    from utils.cache import clear_caches
+
+    clear_caches()
 
-pool = SimpleConnectionPool(1, 10, database_url, cursor_factory=RealDictCursor)
 
+# the pools never wait for a free connection, they refuse straight away. count
+# the refusals so readiness can tell when this worker is out of connections
+pool_refusals = {"primary": 0, "replica": 0}
+last_refused_at = {"primary": 0.0, "replica": 0.0}
 
-def get_conn():
-    return pool.getconn()
+
+def _getconn_from(conn_pool, name: str):
+    try:
+        return conn_pool.getconn()
+    except PoolError:
+        pool_refusals[name] += 1
+        last_refused_at[name] = time.monotonic()
+        raise
+
+
+def get_conn(read_only: bool = False, query_class: str = "default"):
+    if read_only and replica_pool is not None and not read_from_primary.get():
+        conn = _getconn_from(replica_pool, "replica")
+        conn.from_replica = True
+    else:
+        if not read_only:
+            wrote_to_primary.set(True)
+
+        conn = _getconn_from(pool, "primary")
+
+    conns = checked_out.get()
+    if conns is not None:
+        conns.append(conn)
+
+    # SET LOCAL only lasts until the transaction ends, the pool rolls back
+    # whatever is left open when the connection is returned
+    if query_class != "default":
+        cur = conn.cursor()
+        cur.execute(
+            "SET LOCAL statement_timeout = %s", (STATEMENT_TIMEOUTS[query_class],)
+        )
+        cur.close()
+
+    return conn
 
 
 def put_conn(conn):
-    pool.putconn(conn)
+    conns = checked_out.get()
+    if conns is not None and conn in conns:
+        conns.remove(conn)
+
+    if conn.from_replica:
+        replica_pool.putconn(conn)
+    else:
+        pool.putconn(conn)
+
+
+def put_leftover_conns():
+    conns = checked_out.get()
+    if not conns:
+        return
+
+    for conn in list(conns):
+        put_conn(conn)
+
+
+def pool_stats() -> dict:
+    stats = {}
+
+    for name, conn_pool in (("primary", pool), ("replica", replica_pool)):
+        if conn_pool is None:
+            continue
+
+        in_use = len(conn_pool._used)
+        stats[name] = {
+            "in_use": in_use,
+            "idle": len(conn_pool._pool),
+            "max": conn_pool.maxconn,
+            "saturation": round(in_use / conn_pool.maxconn, 2),
+            "refused": pool_refusals[name],
+            "seconds_since_refused": (
+                round(time.monotonic() - last_refused_at[name], 1)
+                if last_refused_at[name]
+                else None
+            ),
+        }
+
+    return stats
+
+
+# runs SELECT 1 on a pooled connection of each pool, returns name -> error or None
+def ping_database() -> dict:
+    results = {}
+
+    for name, conn_pool in (("primary", pool), ("replica", replica_pool)):
+        if conn_pool is None:
+            continue
+
+        conn = None
+        try:
+            conn = _getconn_from(conn_pool, name)
+            cur = conn.cursor()
+            cur.execute(
+                "SET LOCAL statement_timeout = %s", (STATEMENT_TIMEOUTS["ping"],)
+            )
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            results[name] = None
+        except Exception as e:
+            results[name] = str(e).strip() or e.__class__.__name__
+        finally:
+            if conn is not None:
+                conn_pool.putconn(conn)
+
+    return results
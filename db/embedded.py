@@ -0,0 +1,165 @@
+import glob
+import itertools
+import os
+import shutil
+import subprocess
+import tempfile
+
+import psycopg2
+
+DB_DIR = os.path.dirname(__file__)
+SCHEMA_FILE = os.path.join(DB_DIR, "schema.sql")
+MIGRATIONS_DIR = os.path.join(DB_DIR, "migrations")
+
+TEMPLATE_DATABASE = "utd_link_template"
+
+NO_INITDB_MESSAGE = (
+    "initdb was not found, install postgres or set PG_BIN_DIR to its bin folder"
+)
+ROOT_MESSAGE = "the embedded database can not run as root, run as an unprivileged user"
+
+
+# a throwaway postgres cluster in a temp directory, for tests and benchmarks.
+# the cluster starts once, the schema and migrations are loaded into a
+# template database, and every create_database() clones that template, so
+# each test gets its own database in a few milliseconds. durability is turned
+# off since nothing in it has to survive
+class EmbeddedPostgres:
+    def __init__(self, bin_dir: str = None):
+        self.bin_dir = bin_dir or os.getenv("PG_BIN_DIR") or self._find_bin_dir()
+
+        self.base_dir = None
+        self._names = itertools.count(1)
+
+    @staticmethod
+    def _find_bin_dir() -> str:
+        initdb = shutil.which("initdb")
+        if initdb is None:
+            raise RuntimeError(NO_INITDB_MESSAGE)
+
+        return os.path.dirname(initdb)
+
+    # why a cluster can not start here, None when it can. initdb and postgres
+    # refuse to run as root and only say so in a line of stderr, so this is
+    # checked up front
+    @staticmethod
+    def unavailable_reason(bin_dir: str = None):
+        if hasattr(os, "geteuid") and os.geteuid() == 0:
+            return ROOT_MESSAGE
+
+        bin_dir = bin_dir or os.getenv("PG_BIN_DIR")
+        initdb = os.path.join(bin_dir, "initdb") if bin_dir else shutil.which("initdb")
+        if initdb is None or not os.path.exists(initdb):
+            return NO_INITDB_MESSAGE
+
+        return None
+
+    def _run(self, program: str, *args):
+        result = subprocess.run(
+            [os.path.join(self.bin_dir, program), *args],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+
+        if result.returncode != 0:
+            raise RuntimeError(f"{program} failed: {result.stderr.strip()}")
+
+    @property
+    def data_dir(self) -> str:
+        return os.path.join(self.base_dir, "data")
+
+    def dsn(self, dbname: str = "postgres") -> str:
+        return f"host={self.base_dir} port=5432 user=postgres dbname={dbname}"
+
+    def start(self):
+        reason = self.unavailable_reason(self.bin_dir)
+        if reason is not None:
+            raise RuntimeError(reason)
+
+        self.base_dir = tempfile.mkdtemp(prefix="utd-link-pg-")
+
+        self._run(
+            "initdb",
+            "-D",
+            self.data_dir,
+            "-U",
+            "postgres",
+            "-A",
+            "trust",
+            "-E",
+            "UTF8",
+            "--no-sync",
+        )
+
+        # unix socket only, inside the temp directory, so clusters never collide
+        server_options = (
+            f"-k {self.base_dir} -c listen_addresses='' "
+            "-c fsync=off -c synchronous_commit=off -c full_page_writes=off"
+        )
+        self._run(
+            "pg_ctl",
+            "-D",
+            self.data_dir,
+            "-l",
+            os.path.join(self.base_dir, "log"),
+            "-o",
+            server_options,
+            "-w",
+            "start",
+        )
+
+        self._create_template()
+        return self
+
+    def stop(self):
+        if self.base_dir is None:
+            return
+
+        try:
+            self._run("pg_ctl", "-D", self.data_dir, "-m", "immediate", "stop")
+        finally:
+            shutil.rmtree(self.base_dir, ignore_errors=True)
+            self.base_dir = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _execute(self, dbname: str, *statements):
+        conn = psycopg2.connect(self.dsn(dbname))
+        conn.autocommit = True
+
+        try:
+            cur = conn.cursor()
+            for statement in statements:
+                cur.execute(statement)
+            cur.close()
+        finally:
+            conn.close()
+
+    def _create_template(self):
+        self._execute("postgres", f"CREATE DATABASE {TEMPLATE_DATABASE}")
+
+        sql_files = [SCHEMA_FILE]
+        sql_files += sorted(glob.glob(os.path.join(MIGRATIONS_DIR, "*.sql")))
+
+        statements = []
+        for sql_file in sql_files:
+            with open(sql_file) as f:
+                statements.append(f.read())
+
+        self._execute(TEMPLATE_DATABASE, *statements)
+
+    def create_database(self, name: str = None) -> str:
+        name = name or f"utd_link_{next(self._names)}"
+        self._execute(
+            "postgres", f"CREATE DATABASE {name} TEMPLATE {TEMPLATE_DATABASE}"
+        )
+
+        return self.dsn(name)
+
+    def drop_database(self, name: str):
+        self._execute("postgres", f"DROP DATABASE IF EXISTS {name} WITH (FORCE)")
@@ -0,0 +1,28 @@
+-- indexes behind the dashboard organizations tab
+
+-- the user's own organizations and the representative checks
+CREATE INDEX IF NOT EXISTS organizations_org_rep_id_idx
+    ON organizations (org_rep_id);
+
+-- pages of other organizations, optionally filtered by type, in name order
+CREATE INDEX IF NOT EXISTS organizations_org_name_idx
+    ON organizations (org_name);
+
+CREATE INDEX IF NOT EXISTS organizations_org_type_org_name_idx
+    ON organizations (org_type, org_name);
+
+-- substring search on the organization name. pg_trgm ships with the contrib
+-- package, without it the search still works, it just scans the table
+DO
+$$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+            CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+            CREATE INDEX IF NOT EXISTS organizations_org_name_trgm_idx
+                ON organizations USING gin (org_name gin_trgm_ops);
+        ELSE
+            RAISE NOTICE 'pg_trgm is not available, skipping organizations_org_name_trgm_idx';
+        END IF;
+    END
+$$;
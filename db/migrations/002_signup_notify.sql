@@ -0,0 +1,23 @@
+-- notifies the signup_changes channel with the opp_id whenever a signup is
+-- added or removed, the app fans these out to the browsers watching the opportunity
+
+CREATE OR REPLACE FUNCTION notify_signup_change() RETURNS trigger AS
+$$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('signup_changes', OLD.opp_id::text);
+    ELSE
+        PERFORM pg_notify('signup_changes', NEW.opp_id::text);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS signup_changes_notify ON signup;
+
+CREATE TRIGGER signup_changes_notify
+    AFTER INSERT OR DELETE
+    ON signup
+    FOR EACH ROW
+EXECUTE FUNCTION notify_signup_change();
@@ -0,0 +1,36 @@
+-- keeps the number of signups of each opportunity on the opportunity itself so
+-- count reads are a single column lookup instead of a COUNT(*) over signup
+
+ALTER TABLE opportunities
+    ADD COLUMN IF NOT EXISTS signup_count integer NOT NULL DEFAULT 0;
+
+UPDATE opportunities AS opp
+SET signup_count = counts.signup_count
+FROM (SELECT opp_id, COUNT(*) AS signup_count
+      FROM signup
+      GROUP BY opp_id) AS counts
+WHERE opp.opp_id = counts.opp_id;
+
+-- runs inside the transaction that adds or removes the signup
+CREATE OR REPLACE FUNCTION maintain_signup_count() RETURNS trigger AS
+$$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE opportunities SET signup_count = signup_count - 1 WHERE opp_id = OLD.opp_id;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE opportunities SET signup_count = signup_count + 1 WHERE opp_id = NEW.opp_id;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS signup_count_maintain ON signup;
+
+CREATE TRIGGER signup_count_maintain
+    AFTER INSERT OR DELETE OR UPDATE OF opp_id
+    ON signup
+    FOR EACH ROW
+EXECUTE FUNCTION maintain_signup_count();
@@ -0,0 +1,12 @@
+-- the personalized "recommended for you" feed. filled by the
+-- refresh-recommendations command, the dashboard reads one user's rows in
+-- rank order through the primary key
+
+CREATE TABLE IF NOT EXISTS user_recommendations
+(
+    user_id integer NOT NULL REFERENCES users (user_id) ON DELETE CASCADE,
+    rank    integer NOT NULL,
+    opp_id  integer NOT NULL REFERENCES opportunities (opp_id) ON DELETE CASCADE,
+    score   real    NOT NULL,
+    PRIMARY KEY (user_id, rank)
+);
@@ -0,0 +1,40 @@
+-- cold storage for ended opportunities and their signups. the
+-- archive-opportunities command moves rows here in batches, so opportunities
+-- and signup only hold the current working set. rows keep their original ids
+
+CREATE TABLE IF NOT EXISTS opportunities_archive
+(
+    opp_id        integer PRIMARY KEY,
+    title         text        NOT NULL,
+    opp_image_url text,
+    description   text        NOT NULL,
+    category      text        NOT NULL,
+    start_date    date        NOT NULL,
+    end_date      date,
+    max_signups   integer,
+    signup_count  integer     NOT NULL DEFAULT 0,
+    org_id        integer     NOT NULL REFERENCES organizations (org_id) ON DELETE CASCADE,
+    archived_at   timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS signup_archive
+(
+    signup_id   integer PRIMARY KEY,
+    user_id     integer NOT NULL REFERENCES users (user_id) ON DELETE CASCADE,
+    opp_id      integer NOT NULL REFERENCES opportunities_archive (opp_id) ON DELETE CASCADE,
+    signup_date date    NOT NULL,
+    status      text    NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS opportunities_archive_org_id_idx
+    ON opportunities_archive (org_id);
+
+CREATE INDEX IF NOT EXISTS signup_archive_opp_id_idx
+    ON signup_archive (opp_id);
+
+CREATE INDEX IF NOT EXISTS signup_archive_user_id_idx
+    ON signup_archive (user_id);
+
+-- lets the archiver find ended opportunities without scanning the table
+CREATE INDEX IF NOT EXISTS opportunities_ended_on_idx
+    ON opportunities ((COALESCE(end_date, start_date)));
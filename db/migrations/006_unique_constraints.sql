@@ -0,0 +1,20 @@
+-- the uniqueness rules the app used to check with a lookup before every
+-- insert or update. the writes now rely on these and turn the unique
+-- violation into the usual error message. existing duplicates have to be
+-- resolved before this migration can run
+
+CREATE UNIQUE INDEX IF NOT EXISTS users_email_key
+    ON users (email);
+
+CREATE UNIQUE INDEX IF NOT EXISTS users_utd_net_id_key
+    ON users (utd_net_id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS organizations_org_name_key
+    ON organizations (org_name);
+
+-- the unique index serves the name ordered pages as well
+DROP INDEX IF EXISTS organizations_org_name_idx;
+
+-- titles only have to be unique within an organization
+CREATE UNIQUE INDEX IF NOT EXISTS opportunities_org_id_title_key
+    ON opportunities (org_id, title);
@@ -0,0 +1,9 @@
+-- a user can sign up for an opportunity once. the signup route checks this
+-- first, the constraint catches two signups racing past that check. existing
+-- duplicates have to be removed before this migration can run
+
+CREATE UNIQUE INDEX IF NOT EXISTS signup_user_id_opp_id_key
+    ON signup (user_id, opp_id);
+
+-- the unique index serves the lookups by user as well
+DROP INDEX IF EXISTS signup_user_id_idx;
@@ -0,0 +1,51 @@
+-- rejected and cancelled signups no longer hold a place. signup_count only
+-- counts the other ones, so the capacity checks reading it free the place as
+-- soon as a signup is rejected or cancelled, and give it back if it is moved
+-- to another status again
+
+CREATE OR REPLACE FUNCTION maintain_signup_count() RETURNS trigger AS
+$$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        IF OLD.status NOT IN ('rejected', 'cancelled') THEN
+            UPDATE opportunities SET signup_count = signup_count - 1 WHERE opp_id = OLD.opp_id;
+        END IF;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        IF NEW.status NOT IN ('rejected', 'cancelled') THEN
+            UPDATE opportunities SET signup_count = signup_count + 1 WHERE opp_id = NEW.opp_id;
+        END IF;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS signup_count_maintain ON signup;
+
+CREATE TRIGGER signup_count_maintain
+    AFTER INSERT OR DELETE OR UPDATE OF opp_id, status
+    ON signup
+    FOR EACH ROW
+EXECUTE FUNCTION maintain_signup_count();
+
+-- a status change can free or take a place, so the capacity streams hear about it
+DROP TRIGGER IF EXISTS signup_changes_notify ON signup;
+
+CREATE TRIGGER signup_changes_notify
+    AFTER INSERT OR DELETE OR UPDATE OF status
+    ON signup
+    FOR EACH ROW
+EXECUTE FUNCTION notify_signup_change();
+
+UPDATE opportunities AS opp
+SET signup_count = counts.signup_count
+FROM (SELECT opp.opp_id, COUNT(sup.signup_id) AS signup_count
+      FROM opportunities AS opp
+               LEFT JOIN signup AS sup
+                         ON sup.opp_id = opp.opp_id
+                             AND sup.status NOT IN ('rejected', 'cancelled')
+      GROUP BY opp.opp_id) AS counts
+WHERE opp.opp_id = counts.opp_id
+  AND opp.signup_count <> counts.signup_count;
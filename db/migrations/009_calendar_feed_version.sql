@@ -0,0 +1,6 @@
+-- calendar feed links carry this version next to the user id. resetting the
+-- link bumps it, which revokes every link handed out before without touching
+-- anyone else's. links made before this migration count as version 1
+
+ALTER TABLE users
+    ADD COLUMN IF NOT EXISTS calendar_feed_version integer NOT NULL DEFAULT 1;
@@ -0,0 +1,19 @@
+# registry of the hot statements that run on nearly every request. each pooled
+# connection prepares a statement the first time it is used and afterwards only
+# sends EXECUTE, so postgres skips parsing and planning it again
+PREPARED_STATEMENTS = {}
+
+
+def register_prepared_statement(name: str, sql: str):
+    PREPARED_STATEMENTS[name] = sql
+
+
+def execute_prepared(cur, name: str, params: tuple):
+    conn = cur.connection
+
+    if name not in conn.prepared_statements:
+        cur.execute(f"PREPARE {name} AS {PREPARED_STATEMENTS[name]}")
+        conn.prepared_statements.add(name)
+
+    placeholders = ", ".join(["%s"] * len(params))
+    cur.execute(f"EXECUTE {name} ({placeholders})", params)
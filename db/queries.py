@@ -1,13 +1,30 @@
 from datetime import datetime
 
+from psycopg2.errors import UniqueViolation
+from psycopg2.extras import execute_values
+
+from utils.auth_cache import representative_cache
+from utils.cache import MISSING
+from utils.calendar_feed import calendar_cache
+from utils.org_cache import org_type_counts_cache
 from .connection import get_conn, put_conn
+from .prepared import register_prepared_statement, execute_prepared
+from .rows import (
+    TupleCursor,
+    fetchone_as,
+    fetchall_as,
+    UserRow,
+    UserCredentialsRow,
+    OrgRow,
+    SignupRow,
+)
 
 
 # ********************************
 # sql injection
 # ********************************
 def get_user_by_email_and_password_sql_injection(email: str, password: str):
-    conn = get_conn()
+    conn = get_conn(read_only=True)
     cur = conn.cursor()
 
     sql = (
@@ -33,11 +50,13 @@ def get_user_by_email_and_password_sql_injection(email: str, password: str):
 # queries for users table
 # ********************************
 def get_user_by_email(email: str):
-    conn = get_conn()
-    cur = conn.cursor()
+    conn = get_conn(read_only=True)
+    cur = conn.cursor(cursor_factory=TupleCursor)
 
-    cur.execute("SELECT * FROM users WHERE email = %s", (email,))
-    row = cur.fetchone()
+    cur.execute(
+        "SELECT user_id, first_name, password FROM users WHERE email = %s", (email,)
+    )
+    row = fetchone_as(cur, UserCredentialsRow)
 
     cur.close()
     put_conn(conn)
@@ -45,12 +64,18 @@ def get_user_by_email(email: str):
     return row
 
 
-def get_user_by_net_id(net_id: str):
-    conn = get_conn()
-    cur = conn.cursor()
+register_prepared_statement(
+    "get_user_by_id",
+    "SELECT user_id, first_name, last_name, utd_net_id, email, role FROM users WHERE user_id = $1",
+)
 
-    cur.execute("SELECT * FROM users WHERE utd_net_id = %s", (net_id,))
-    row = cur.fetchone()
+
+def get_user_by_id(user_id: str):
+    conn = get_conn(read_only=True)
+    cur = conn.cursor(cursor_factory=TupleCursor)
+
+    execute_prepared(cur, "get_user_by_id", (user_id,))
+    row = fetchone_as(cur, UserRow)
 
     cur.close()
     put_conn(conn)
@@ -58,39 +83,74 @@ def get_user_by_net_id(net_id: str):
     return row
 
 
-def get_user_by_id(user_id: str):
-    conn = get_conn()
+# None when the user does not exist
+def get_calendar_feed_version(user_id: int):
+    conn = get_conn(read_only=True)
     cur = conn.cursor()
 
-    cur.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
+    cur.execute(
+        "SELECT calendar_feed_version FROM users WHERE user_id = %s", (user_id,)
+    )
     row = cur.fetchone()
 
     cur.close()
     put_conn(conn)
 
-    return row
+    if row is None:
+        return None
 
+    return row["calendar_feed_version"]
 
-def create_new_user(first_name, last_name, net_id, email, password, role):
+
+# revokes the user's calendar feed links, returns the new version
+def reset_calendar_feed(user_id: int):
     conn = get_conn()
     cur = conn.cursor()
 
-    cur.execute(
-        "INSERT INTO users (first_name, last_name, utd_net_id, email, password, role) VALUES (%s, %s, %s, %s, %s, %s) RETURNING user_id",
-        (
-            first_name,
-            last_name,
-            net_id,
-            email,
-            password,
-            role,
-        ),
-    )
-    new_user_id = cur.fetchone()["user_id"]
-    conn.commit()
+    try:
+        cur.execute(
+            "UPDATE users SET calendar_feed_version = calendar_feed_version + 1 WHERE user_id = %s RETURNING calendar_feed_version",
+            (user_id,),
+        )
+        version = cur.fetchone()["calendar_feed_version"]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        put_conn(conn)
 
-    cur.close()
-    put_conn(conn)
+    calendar_cache.invalidate(user_id)
+
+    return version
+
+
+# raises UniqueViolation when the email or the net id is already taken
+def create_new_user(first_name, last_name, net_id, email, password, role):
+    conn = get_conn()
+    cur = conn.cursor()
+
+    try:
+        cur.execute(
+            "INSERT INTO users (first_name, last_name, utd_net_id, email, password, role) VALUES (%s, %s, %s, %s, %s, %s) RETURNING user_id",
+            (
+                first_name,
+                last_name,
+                net_id,
+                email,
+                password,
+                role,
+            ),
+        )
+        new_user_id = cur.fetchone()["user_id"]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        put_conn(conn)
 
     return new_user_id
 
@@ -99,11 +159,14 @@ def create_new_user(first_name, last_name, net_id, email, password, role):
 # queries for organizations table
 # ********************************
 def get_all_user_orgs(user_id: str):
-    conn = get_conn()
-    cur = conn.cursor()
+    conn = get_conn(read_only=True)
+    cur = conn.cursor(cursor_factory=TupleCursor)
 
-    cur.execute("SELECT * FROM organizations WHERE org_rep_id = %s", (user_id,))
-    rows = cur.fetchall()
+    cur.execute(
+        "SELECT org_id, org_name, org_type, org_email, org_image_url, org_rep_id FROM organizations WHERE org_rep_id = %s",
+        (user_id,),
+    )
+    rows = fetchall_as(cur, OrgRow)
 
     cur.close()
     put_conn(conn)
@@ -111,34 +174,127 @@ def get_all_user_orgs(user_id: str):
     return rows
 
 
-def get_all_non_user_orgs(user_id: str):
-    conn = get_conn()
-    cur = conn.cursor()
+def get_org_type_counts():
+    counts = org_type_counts_cache.get("all")
+    if counts is not MISSING:
+        return counts
 
-    cur.execute("SELECT * FROM organizations WHERE org_rep_id <> %s", (user_id,))
-    rows = cur.fetchall()
+    conn = get_conn(read_only=True)
+    cur = conn.cursor(cursor_factory=TupleCursor)
+
+    # an index only scan of organizations_org_type_org_name_idx
+    cur.execute("SELECT org_type, COUNT(*) FROM organizations GROUP BY org_type")
+    counts = dict(cur.fetchall())
 
     cur.close()
     put_conn(conn)
 
-    return rows
+    org_type_counts_cache.set("all", counts)
 
+    return counts
 
-def get_org_by_name(org_name: str):
-    conn = get_conn()
+
+def get_dashboard_organizations(
+        user_id: int,
+        search: str = None,
+        org_type: str = None,
+        limit: int = 24,
+        after: str = None,
+        before: str = None,
+):
+    conn = get_conn(read_only=True)
     cur = conn.cursor()
 
-    cur.execute("SELECT * FROM organizations WHERE org_name = %s", (org_name,))
+    search_pattern = None
+    if search:
+        escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        search_pattern = f"%{escaped}%"
+
+    # pages are keyset paginated on the unique org name, so every page is a
+    # short range scan of the name index no matter how deep it is. going back
+    # walks the index the other way from the first name on the current page
+    backwards = before is not None and after is None
+    page_order = "DESC" if backwards else "ASC"
+
+    # without a search the counts come from get_org_type_counts. with one they
+    # only aggregate the orgs the trigram index finds for it
+    type_counts_sql = "NULL::json"
+    if search_pattern:
+        type_counts_sql = """
+               (SELECT COALESCE(json_object_agg(t.org_type, t.type_count ORDER BY t.org_type), '{}'::json)
+                FROM (SELECT org_type, COUNT(*) AS type_count
+                      FROM organizations
+                      WHERE org_name ILIKE %(search_pattern)s
+                        AND org_rep_id <> %(user_id)s
+                      GROUP BY org_type) AS t)"""
+
+    # the user's own orgs and one page of the other orgs, plus one extra row
+    # telling whether there is more in the direction of travel
+    cur.execute(
+        f"""
+        SELECT (SELECT COALESCE(json_agg(u ORDER BY u.org_name), '[]'::json)
+                FROM (SELECT org_id, org_name, org_type, org_image_url
+                      FROM organizations
+                      WHERE org_rep_id = %(user_id)s) AS u) AS user_orgs,
+               (SELECT COALESCE(json_agg(p ORDER BY p.org_name), '[]'::json)
+                FROM (SELECT org_id, org_name, org_type, org_image_url
+                      FROM organizations
+                      WHERE org_rep_id <> %(user_id)s
+                        AND (%(org_type)s::text IS NULL OR org_type = %(org_type)s)
+                        AND (%(search_pattern)s::text IS NULL OR org_name ILIKE %(search_pattern)s)
+                        AND (%(after)s::text IS NULL OR org_name > %(after)s)
+                        AND (%(before)s::text IS NULL OR org_name < %(before)s)
+                      ORDER BY org_name {page_order}
+                      LIMIT %(limit)s + 1) AS p)               AS organizations,
+               {type_counts_sql} AS type_counts
+        """,
+        {
+            "user_id": user_id,
+            "search_pattern": search_pattern,
+            "org_type": org_type,
+            "limit": limit,
+            "after": after,
+            "before": None if after is not None else before,
+        },
+    )
     row = cur.fetchone()
 
     cur.close()
     put_conn(conn)
 
-    return row
+    organizations = row["organizations"]
+    has_more = len(organizations) > limit
+    if has_more:
+        organizations = organizations[1:] if backwards else organizations[:limit]
+
+    type_counts = row["type_counts"]
+    if type_counts is None:
+        # every org of the type minus the user's own ones
+        type_counts = dict(get_org_type_counts())
+        for org in row["user_orgs"]:
+            type_counts[org["org_type"]] = type_counts.get(org["org_type"], 0) - 1
+
+        type_counts = dict(
+            sorted([(name, count) for name, count in type_counts.items() if count > 0])
+        )
+
+    if org_type:
+        total = type_counts.get(org_type, 0)
+    else:
+        total = sum(type_counts.values())
+
+    return {
+        "user_orgs": row["user_orgs"],
+        "organizations": organizations,
+        "type_counts": type_counts,
+        "total": total,
+        "has_previous": has_more if backwards else after is not None,
+        "has_next": before is not None if backwards else has_more,
+    }
 
 
 def get_org_details(org_id: int):
-    conn = get_conn()
+    conn = get_conn(read_only=True)
     cur = conn.cursor()
 
     cur.execute(
@@ -165,45 +321,114 @@ def get_org_details(org_id: int):
     return row
 
 
-def create_new_org(org_name, org_type, org_email, org_image_url, user_id):
-    conn = get_conn()
+# the public organization page: the org, its representative, one page of its
+# current opportunities and how many there are in total, in a single row
+def get_org_details_page(org_id: int, limit: int = 24, offset: int = 0):
+    conn = get_conn(read_only=True)
     cur = conn.cursor()
 
-    if len(org_image_url) > 0:
-        cur.execute(
-            "INSERT INTO organizations (org_name, org_type, org_email, org_image_url, org_rep_id) VALUES (%s, %s, %s, %s, %s)",
-            (org_name, org_type, org_email, org_image_url, user_id),
-        )
-    else:
-        cur.execute(
-            "INSERT INTO organizations (org_name, org_type, org_email, org_rep_id) VALUES (%s, %s, %s, %s)",
-            (org_name, org_type, org_email, user_id),
-        )
-    conn.commit()
+    today = datetime.now()
+    date = today.strftime("%Y-%m-%d")
+
+    cur.execute(
+        """
+        SELECT org.org_id,
+               org.org_name,
+               org.org_type,
+               org.org_image_url,
+               org.org_email,
+               u.first_name,
+               u.last_name,
+               u.email                                            AS org_rep_email,
+               (SELECT COALESCE(json_agg(o ORDER BY o.start_date, o.opp_id), '[]'::json)
+                FROM (SELECT opp_id,
+                             title,
+                             opp_image_url,
+                             category,
+                             start_date,
+                             end_date,
+                             max_signups,
+                             signup_count AS total_signups,
+                             org_id,
+                             org.org_name
+                      FROM opportunities
+                      WHERE org_id = org.org_id
+                        AND (start_date >= %(date)s OR end_date >= %(date)s)
+                      ORDER BY start_date, opp_id
+                      LIMIT %(limit)s OFFSET %(offset)s) AS o)   AS opportunities,
+               (SELECT COUNT(*)
+                FROM opportunities
+                WHERE org_id = org.org_id
+                  AND (start_date >= %(date)s OR end_date >= %(date)s)) AS total_opportunities
+        FROM organizations AS org,
+             users AS u
+        WHERE org.org_id = %(org_id)s
+          AND org.org_rep_id = u.user_id
+        """,
+        {"org_id": org_id, "date": date, "limit": limit, "offset": offset},
+    )
+    row = cur.fetchone()
 
     cur.close()
     put_conn(conn)
 
+    return row
+
 
+# raises UniqueViolation when the name is already taken
+def create_new_org(org_name, org_type, org_email, org_image_url, user_id):
+    conn = get_conn()
+    cur = conn.cursor()
+
+    try:
+        if len(org_image_url) > 0:
+            cur.execute(
+                "INSERT INTO organizations (org_name, org_type, org_email, org_image_url, org_rep_id) VALUES (%s, %s, %s, %s, %s)",
+                (org_name, org_type, org_email, org_image_url, user_id),
+            )
+        else:
+            cur.execute(
+                "INSERT INTO organizations (org_name, org_type, org_email, org_rep_id) VALUES (%s, %s, %s, %s)",
+                (org_name, org_type, org_email, user_id),
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        put_conn(conn)
+
+    org_type_counts_cache.invalidate("all")
+
+
+# raises UniqueViolation when the new name is already taken
 def update_org(org_name, org_type, org_email, org_image_url, org_id):
     conn = get_conn()
     cur = conn.cursor()
 
-    cur.execute(
-        """
-        UPDATE organizations
-        SET org_name      = %s,
-            org_type      = %s,
-            org_email     = %s,
-            org_image_url = %s
-        WHERE org_id = %s
-        """,
-        (org_name, org_type, org_email, org_image_url, org_id),
-    )
-    conn.commit()
+    try:
+        cur.execute(
+            """
+            UPDATE organizations
+            SET org_name      = %s,
+                org_type      = %s,
+                org_email     = %s,
+                org_image_url = %s
+            WHERE org_id = %s
+            """,
+            (org_name, org_type, org_email, org_image_url, org_id),
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        put_conn(conn)
 
-    cur.close()
-    put_conn(conn)
+    representative_cache.invalidate(org_id)
+    org_type_counts_cache.invalidate("all")
 
 
 def delete_org(org_id):
@@ -223,28 +448,34 @@ def delete_org(org_id):
     cur.close()
     put_conn(conn)
 
+    representative_cache.invalidate(org_id)
+    org_type_counts_cache.invalidate("all")
+
+
+register_prepared_statement(
+    "check_is_representative",
+    "SELECT 1 FROM organizations WHERE org_id = $1 AND org_rep_id = $2",
+)
+
 
 def check_is_representative(user_id: int, org_id: int):
-    conn = get_conn()
-    cur = conn.cursor()
+    conn = get_conn(read_only=True)
+    cur = conn.cursor(cursor_factory=TupleCursor)
 
-    cur.execute(
-        "SELECT * FROM organizations WHERE org_id = %s AND org_rep_id = %s",
-        (org_id, user_id),
-    )
+    execute_prepared(cur, "check_is_representative", (org_id, user_id))
     row = cur.fetchone()
 
     cur.close()
     put_conn(conn)
 
-    return row
+    return row is not None
 
 
 # ********************************
 # queries for opportunities table
 # ********************************
 def get_all_current_opportunities():
-    conn = get_conn()
+    conn = get_conn(read_only=True)
     cur = conn.cursor()
 
     today = datetime.now()
@@ -280,7 +511,7 @@ def get_all_current_opportunities():
 
 
 def get_all_current_opportunities_for_org(org_id: int):
-    conn = get_conn()
+    conn = get_conn(read_only=True)
     cur = conn.cursor()
 
     today = datetime.now()
@@ -295,6 +526,7 @@ def get_all_current_opportunities_for_org(org_id: int):
                start_date,
                end_date,
                max_signups,
+               signup_count AS total_signups,
                opp.org_id,
                org.org_name
         FROM opportunities AS opp,
@@ -318,12 +550,9 @@ def get_all_current_opportunities_for_org(org_id: int):
     return rows
 
 
-def get_opportunity_details(opp_id: int):
-    conn = get_conn()
-    cur = conn.cursor()
-
-    cur.execute(
-        """
+register_prepared_statement(
+    "get_opportunity_details",
+    """
         SELECT opp_id,
                title,
                description,
@@ -332,16 +561,23 @@ def get_opportunity_details(opp_id: int):
                start_date,
                end_date,
                max_signups,
+               signup_count AS total_signups,
                opp.org_id,
                org.org_name,
                org.org_rep_id
         FROM opportunities AS opp,
              organizations AS org
-        WHERE opp_id = %s
+        WHERE opp_id = $1
           AND opp.org_id = org.org_id
         """,
-        (opp_id,),
-    )
+)
+
+
+def get_opportunity_details(opp_id: int):
+    conn = get_conn(read_only=True)
+    cur = conn.cursor()
+
+    execute_prepared(cur, "get_opportunity_details", (opp_id,))
     row = cur.fetchone()
 
     cur.close()
@@ -350,24 +586,24 @@ def get_opportunity_details(opp_id: int):
     return row
 
 
-def get_opportunity_for_org_by_title(org_id: int, title: str):
-    conn = get_conn()
+def get_existing_opportunity_titles_for_org(org_id: int, titles: list):
+    conn = get_conn(read_only=True)
     cur = conn.cursor()
 
     cur.execute(
-        "SELECT * FROM opportunities WHERE org_id = %s AND title = %s",
-        (org_id, title),
+        "SELECT title FROM opportunities WHERE org_id = %s AND title = ANY(%s)",
+        (org_id, titles),
     )
-    row = cur.fetchone()
+    rows = cur.fetchall()
 
     cur.close()
     put_conn(conn)
 
-    return row
+    return set([row["title"] for row in rows])
 
 
 def get_max_signups(opp_id: int):
-    conn = get_conn()
+    conn = get_conn(read_only=True)
     cur = conn.cursor()
 
     cur.execute(
@@ -387,6 +623,7 @@ def get_max_signups(opp_id: int):
     return max_signups
 
 
+# raises UniqueViolation when the org already has an opportunity with this title
 def create_new_opportunity(
         title,
         opp_image_url,
@@ -400,39 +637,105 @@ def create_new_opportunity(
     conn = get_conn()
     cur = conn.cursor()
 
-    if len(opp_image_url) > 0:
-        cur.execute(
-            "INSERT INTO opportunities (title, opp_image_url, description, category, start_date, end_date, max_signups, org_id) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
-            (
-                title,
-                opp_image_url,
-                description,
-                category,
-                start_date,
-                end_date,
-                max_signups,
-                org_id,
-            ),
+    try:
+        if len(opp_image_url) > 0:
+            cur.execute(
+                "INSERT INTO opportunities (title, opp_image_url, description, category, start_date, end_date, max_signups, org_id) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+                (
+                    title,
+                    opp_image_url,
+                    description,
+                    category,
+                    start_date,
+                    end_date,
+                    max_signups,
+                    org_id,
+                ),
+            )
+        else:
+            cur.execute(
+                "INSERT INTO opportunities (title, description, category, start_date, end_date, max_signups, org_id) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                (
+                    title,
+                    description,
+                    category,
+                    start_date,
+                    end_date,
+                    max_signups,
+                    org_id,
+                ),
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        put_conn(conn)
+
+
+def create_new_opportunities_bulk(opportunities: list, org_id: int):
+    conn = get_conn(query_class="heavy")
+    cur = conn.cursor()
+
+    # rows without an image leave opp_image_url out so the column default applies
+    with_image = [
+        (
+            opp["title"],
+            opp["opp_image_url"],
+            opp["description"],
+            opp["category"],
+            opp["start_date"],
+            opp["end_date"],
+            opp["max_signups"],
+            org_id,
         )
-    else:
-        cur.execute(
-            "INSERT INTO opportunities (title, description, category, start_date, end_date, max_signups, org_id) VALUES (%s, %s, %s, %s, %s, %s, %s)",
-            (
-                title,
-                description,
-                category,
-                start_date,
-                end_date,
-                max_signups,
-                org_id,
-            ),
+        for opp in opportunities
+        if opp["opp_image_url"]
+    ]
+    without_image = [
+        (
+            opp["title"],
+            opp["description"],
+            opp["category"],
+            opp["start_date"],
+            opp["end_date"],
+            opp["max_signups"],
+            org_id,
         )
-    conn.commit()
-
-    cur.close()
-    put_conn(conn)
-
-
+        for opp in opportunities
+        if not opp["opp_image_url"]
+    ]
+
+    try:
+        if with_image:
+            execute_values(
+                cur,
+                "INSERT INTO opportunities (title, opp_image_url, description, category, start_date, end_date, max_signups, org_id) VALUES %s",
+                with_image,
+                page_size=500,
+            )
+
+        if without_image:
+            execute_values(
+                cur,
+                "INSERT INTO opportunities (title, description, category, start_date, end_date, max_signups, org_id) VALUES %s",
+                without_image,
+                page_size=500,
+            )
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        put_conn(conn)
+
+    return len(opportunities)
+
+
+# raises UniqueViolation when the org already has an opportunity with the new title
 def update_opp(
         title,
         opp_image_url,
@@ -446,33 +749,37 @@ def update_opp(
     conn = get_conn()
     cur = conn.cursor()
 
-    cur.execute(
-        """
-        UPDATE opportunities
-        SET title         = %s,
-            description   = %s,
-            category      = %s,
-            opp_image_url = %s,
-            start_date    = %s,
-            end_date      = %s,
-            max_signups   = %s
-        WHERE opp_id = %s
-        """,
-        (
-            title,
-            description,
-            category,
-            opp_image_url,
-            start_date,
-            end_date,
-            max_signups,
-            opp_id,
-        ),
-    )
-    conn.commit()
-
-    cur.close()
-    put_conn(conn)
+    try:
+        cur.execute(
+            """
+            UPDATE opportunities
+            SET title         = %s,
+                description   = %s,
+                category      = %s,
+                opp_image_url = %s,
+                start_date    = %s,
+                end_date      = %s,
+                max_signups   = %s
+            WHERE opp_id = %s
+            """,
+            (
+                title,
+                description,
+                category,
+                opp_image_url,
+                start_date,
+                end_date,
+                max_signups,
+                opp_id,
+            ),
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        put_conn(conn)
 
 
 def delete_opp(opp_id):
@@ -497,7 +804,7 @@ def delete_opp(opp_id):
 # queries for signup table
 # ********************************
 def get_user_signups(user_id: str):
-    conn = get_conn()
+    conn = get_conn(read_only=True)
     cur = conn.cursor()
 
     cur.execute(
@@ -509,11 +816,14 @@ def get_user_signups(user_id: str):
                start_date,
                end_date,
                signup_date,
-               status
+               status,
+               org.org_name
         FROM signup AS sup,
-             opportunities AS opp
+             opportunities AS opp,
+             organizations AS org
         WHERE user_id = %s
           AND sup.opp_id = opp.opp_id
+          AND opp.org_id = org.org_id
         ORDER BY signup_date DESC
         """,
         (user_id,),
@@ -526,38 +836,32 @@ def get_user_signups(user_id: str):
     return rows
 
 
-def get_all_signups_for_org(org_id):
-    conn = get_conn()
+# signups for opportunities that were moved to the archive tables
+def get_user_signup_history(user_id: int, limit: int, offset: int = 0):
+    conn = get_conn(read_only=True)
     cur = conn.cursor()
 
-    today = datetime.now()
-    date = today.strftime("%Y-%m-%d")
-
     cur.execute(
         """
         SELECT sup.signup_id,
                opp.opp_id,
                opp.title,
+               opp.category,
                opp.start_date,
                opp.end_date,
-               u.user_id,
-               u.first_name,
-               u.last_name,
-               u.email,
                sup.signup_date,
-               sup.status
-        FROM opportunities AS opp
-                 LEFT JOIN signup AS sup ON sup.opp_id = opp.opp_id
-                 LEFT JOIN users AS u ON sup.user_id = u.user_id
-        WHERE opp.org_id = %s
-          AND (opp.start_date >= %s OR opp.end_date <= %s)
-        ORDER BY opp.start_date ASC, sup.signup_date ASC;
+               sup.status,
+               org.org_name
+        FROM signup_archive AS sup,
+             opportunities_archive AS opp,
+             organizations AS org
+        WHERE sup.user_id = %s
+          AND sup.opp_id = opp.opp_id
+          AND opp.org_id = org.org_id
+        ORDER BY opp.start_date DESC, sup.signup_id DESC
+        LIMIT %s OFFSET %s
         """,
-        (
-            org_id,
-            date,
-            date,
-        ),
+        (user_id, limit, offset),
     )
     rows = cur.fetchall()
 
@@ -567,42 +871,97 @@ def get_all_signups_for_org(org_id):
     return rows
 
 
-def get_signup_details_by_id(signup_id: int):
-    conn = get_conn()
+def get_all_signups_for_org(
+        org_id: int, signups_limit: int = None, signups_offset: int = 0, opp_id: int = None
+):
+    conn = get_conn(read_only=True, query_class="heavy")
     cur = conn.cursor()
 
+    today = datetime.now()
+    date = today.strftime("%Y-%m-%d")
+
+    # one row per opportunity, with its signups already nested as json. a null
+    # signups_limit returns every signup, otherwise each opportunity gets one page
     cur.execute(
         """
-        SELECT sup.signup_id, sup.user_id, sup.opp_id, org.org_rep_id
-        FROM signup AS sup,
-             organizations AS org,
-             opportunities AS opp
-        WHERE sup.signup_id = %s
-          AND sup.opp_id = opp.opp_id
-          AND opp.org_id = org.org_id
+        SELECT opp.opp_id,
+               opp.title,
+               opp.start_date,
+               opp.end_date,
+               opp.signup_count                    AS total_signups,
+               COALESCE(page.signups, '[]'::json) AS signups
+        FROM opportunities AS opp
+                 LEFT JOIN LATERAL (
+            SELECT json_agg(
+                           json_build_object(
+                                   'signup_id', s.signup_id,
+                                   'signup_date', s.signup_date,
+                                   'status', s.status,
+                                   'user', json_build_object(
+                                           'user_id', s.user_id,
+                                           'first_name', s.first_name,
+                                           'last_name', s.last_name,
+                                           'email', s.email
+                                           )
+                           )
+                           ORDER BY s.signup_date ASC, s.signup_id ASC
+                   ) AS signups
+            FROM (SELECT sup.signup_id,
+                         sup.signup_date,
+                         sup.status,
+                         u.user_id,
+                         u.first_name,
+                         u.last_name,
+                         u.email
+                  FROM signup AS sup,
+                       users AS u
+                  WHERE sup.opp_id = opp.opp_id
+                    AND sup.user_id = u.user_id
+                  ORDER BY sup.signup_date ASC, sup.signup_id ASC
+                  LIMIT %s OFFSET %s) AS s
+            ) AS page ON TRUE
+        WHERE opp.org_id = %s
+          AND (opp.start_date >= %s OR opp.end_date <= %s)
+          AND (%s::int IS NULL OR opp.opp_id = %s::int)
+        ORDER BY opp.start_date ASC;
         """,
-        (signup_id,),
+        (
+            signups_limit,
+            signups_offset,
+            org_id,
+            date,
+            date,
+            opp_id,
+            opp_id,
+        ),
     )
-    row = cur.fetchone()
+    rows = cur.fetchall()
 
     cur.close()
     put_conn(conn)
 
-    return row
+    return rows
+
+
+register_prepared_statement(
+    "get_signup_by_user_and_opp",
+    "SELECT signup_id, user_id, opp_id, signup_date, status FROM signup WHERE user_id = $1 AND opp_id = $2",
+)
 
 
 def get_signup_by_user_and_opp(user_id: int, opp_id: int):
-    conn = get_conn()
-    cur = conn.cursor()
+    conn = get_conn(read_only=True)
+    cur = conn.cursor(cursor_factory=TupleCursor)
 
-    cur.execute(
-        "SELECT * FROM signup WHERE user_id = %s AND opp_id = %s",
+    execute_prepared(
+        cur,
+        "get_signup_by_user_and_opp",
         (
             user_id,
             opp_id,
         ),
     )
-    row = cur.fetchone()
+    row = fetchone_as(cur, SignupRow)
 
     cur.close()
     put_conn(conn)
@@ -610,28 +969,92 @@ def get_signup_by_user_and_opp(user_id: int, opp_id: int):
     return row
 
 
+register_prepared_statement(
+    "get_signup_count_for_opp",
+    "SELECT signup_count FROM opportunities WHERE opp_id = $1",
+)
+
+
 def get_signup_count_for_opp(opp_id: int):
-    conn = get_conn()
+    conn = get_conn(read_only=True)
+    cur = conn.cursor()
+
+    execute_prepared(cur, "get_signup_count_for_opp", (opp_id,))
+    row = cur.fetchone()
+
+    signup_count = 0
+    if row:
+        signup_count = row["signup_count"]
+
+    cur.close()
+    put_conn(conn)
+
+    return signup_count
+
+
+def get_opportunities_capacity(opp_ids: list):
+    conn = get_conn(read_only=True)
     cur = conn.cursor()
 
     cur.execute(
-        "SELECT COUNT(*) FROM signup WHERE opp_id = %s",
-        (opp_id,),
+        """
+        SELECT opp_id, max_signups, signup_count
+        FROM opportunities
+        WHERE opp_id = ANY (%s)
+        """,
+        (opp_ids,),
     )
-    row = cur.fetchone()
+    rows = cur.fetchall()
+
+    cur.close()
+    put_conn(conn)
 
-    signup_count = row["count"]
-    if signup_count:
-        signup_count = int(signup_count)
+    return rows
+
+
+def reconcile_signup_counts(repair: bool = True):
+    conn = get_conn(query_class="maintenance")
+    cur = conn.cursor()
+
+    # opportunities whose stored count differs from the rows in signup.
+    # rejected and cancelled signups do not count, see migration 008
+    drift_sql = """
+        SELECT opp.opp_id,
+               opp.signup_count           AS stored_count,
+               COUNT(sup.signup_id)::int  AS actual_count
+        FROM opportunities AS opp
+                 LEFT JOIN signup AS sup
+                           ON sup.opp_id = opp.opp_id
+                               AND sup.status NOT IN ('rejected', 'cancelled')
+        GROUP BY opp.opp_id
+        HAVING opp.signup_count <> COUNT(sup.signup_id)
+        """
+
+    if repair:
+        cur.execute(
+            f"""
+            WITH drift AS ({drift_sql})
+            UPDATE opportunities AS opp
+            SET signup_count = drift.actual_count
+            FROM drift
+            WHERE opp.opp_id = drift.opp_id
+            RETURNING drift.opp_id, drift.stored_count, drift.actual_count
+            """
+        )
     else:
-        signup_count = 0
+        cur.execute(drift_sql)
+
+    rows = cur.fetchall()
+    conn.commit()
 
     cur.close()
     put_conn(conn)
 
-    return signup_count
+    return rows
 
 
+# returns "success", "already_registered" or "full". the caller has checked
+# that the opportunity exists
 def create_new_signup(user_id: int, opp_id: int):
     conn = get_conn()
     cur = conn.cursor()
@@ -639,33 +1062,452 @@ def create_new_signup(user_id: int, opp_id: int):
     today = datetime.now()
     date = today.strftime("%Y-%m-%d")
 
+    try:
+        # the opportunity row is locked while the signup goes in, so concurrent
+        # signups see each other's signup_count and can not overbook it
+        cur.execute(
+            """
+            INSERT INTO signup (user_id, opp_id, signup_date)
+            SELECT %s, opp_id, %s
+            FROM opportunities
+            WHERE opp_id = %s
+              AND (max_signups IS NULL OR signup_count < max_signups)
+            FOR UPDATE
+            """,
+            (
+                user_id,
+                date,
+                opp_id,
+            ),
+        )
+        inserted = cur.rowcount == 1
+        conn.commit()
+    except UniqueViolation:
+        conn.rollback()
+        return "already_registered"
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        put_conn(conn)
+
+    if not inserted:
+        return "full"
+
+    calendar_cache.invalidate(user_id)
+    return "success"
+
+
+def update_signup_status_for_org(org_id: int, signup_ids: list, status: str):
+    conn = get_conn()
+    cur = conn.cursor()
+
+    # only signups for the org's own opportunities are updated
     cur.execute(
-        "INSERT INTO signup (user_id, opp_id, signup_date) VALUES (%s, %s, %s)",
-        (
-            user_id,
-            opp_id,
-            date,
-        ),
+        """
+        UPDATE signup AS sup
+        SET status = %s
+        FROM opportunities AS opp,
+             users AS u
+        WHERE sup.signup_id = ANY (%s)
+          AND sup.opp_id = opp.opp_id
+          AND opp.org_id = %s
+          AND sup.user_id = u.user_id
+        RETURNING sup.signup_id,
+                  sup.signup_date,
+                  sup.status,
+                  u.user_id,
+                  u.first_name,
+                  u.last_name,
+                  u.email
+        """,
+        (status, signup_ids, org_id),
     )
+    rows = cur.fetchall()
     conn.commit()
 
     cur.close()
     put_conn(conn)
 
+    for user_id in set([row["user_id"] for row in rows]):
+        calendar_cache.invalidate(user_id)
+
+    return rows
+
+
+def create_new_signups_batch(signup_requests: list):
+    conn = get_conn(query_class="heavy")
+    cur = conn.cursor(cursor_factory=TupleCursor)
+
+    today = datetime.now()
+    date = today.strftime("%Y-%m-%d")
 
-def delete_user_signup(signup_id: int):
+    opp_ids = list(set([opp_id for _, opp_id in signup_requests]))
+    user_ids = list(set([user_id for user_id, _ in signup_requests]))
+
+    try:
+        # lock the opportunities so concurrent batches see each other's signups
+        cur.execute(
+            "SELECT opp_id, max_signups, signup_count FROM opportunities WHERE opp_id = ANY (%s) ORDER BY opp_id FOR UPDATE",
+            (opp_ids,),
+        )
+        opportunities = cur.fetchall()
+        max_signups = dict([(opp_id, limit) for opp_id, limit, _ in opportunities])
+        signup_counts = dict([(opp_id, count) for opp_id, _, count in opportunities])
+
+        cur.execute(
+            "SELECT user_id, opp_id FROM signup WHERE opp_id = ANY (%s) AND user_id = ANY (%s)",
+            (opp_ids, user_ids),
+        )
+        registered = set(cur.fetchall())
+
+        # apply the capacity rules in the order the requests arrived
+        outcomes = []
+        new_signups = []
+        for user_id, opp_id in signup_requests:
+            if opp_id not in max_signups:
+                outcomes.append("not_found")
+                continue
+
+            if (user_id, opp_id) in registered:
+                outcomes.append("already_registered")
+                continue
+
+            signup_count = signup_counts.get(opp_id, 0)
+            if max_signups[opp_id] and signup_count >= max_signups[opp_id]:
+                outcomes.append("full")
+                continue
+
+            registered.add((user_id, opp_id))
+            signup_counts[opp_id] = signup_count + 1
+            new_signups.append((user_id, opp_id, date))
+            outcomes.append("success")
+
+        if new_signups:
+            execute_values(
+                cur,
+                "INSERT INTO signup (user_id, opp_id, signup_date) VALUES %s",
+                new_signups,
+                page_size=500,
+            )
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        put_conn(conn)
+
+    for user_id, _, _ in new_signups:
+        calendar_cache.invalidate(user_id)
+
+    return outcomes
+
+
+def delete_user_signup(signup_id: int, user_id: int):
     conn = get_conn()
     cur = conn.cursor()
 
+    # the signup is only deleted when the user owns it or represents the org
+    # behind it. the lookup tells a missing signup apart from a forbidden one
     cur.execute(
         """
-        DELETE
-        FROM signup
-        WHERE signup_id = %s
+        WITH target AS (SELECT sup.signup_id
+                        FROM signup AS sup
+                        WHERE sup.signup_id = %(signup_id)s),
+             deleted AS (
+                 DELETE
+                     FROM signup AS sup
+                         USING opportunities AS opp, organizations AS org
+                     WHERE sup.signup_id = %(signup_id)s
+                         AND sup.opp_id = opp.opp_id
+                         AND opp.org_id = org.org_id
+                         AND (sup.user_id = %(user_id)s OR org.org_rep_id = %(user_id)s)
+                     RETURNING sup.signup_id, sup.opp_id, sup.user_id)
+        SELECT EXISTS (SELECT 1 FROM target)  AS found,
+               EXISTS (SELECT 1 FROM deleted) AS deleted,
+               (SELECT opp_id FROM deleted)   AS opp_id,
+               (SELECT user_id FROM deleted)  AS user_id
         """,
-        (signup_id,),
+        {"signup_id": signup_id, "user_id": user_id},
     )
+    row = cur.fetchone()
     conn.commit()
 
     cur.close()
     put_conn(conn)
+
+    if row["deleted"]:
+        calendar_cache.invalidate(row["user_id"])
+        return "deleted"
+
+    if row["found"]:
+        return "not_authorized"
+
+    return "not_found"
+
+
+# ********************************
+# queries for recommendations
+# ********************************
+# replaces the recommendations of the next batch_size users after
+# after_user_id in one transaction, so locks and the working set stay small
+# however many users there are. returns the last user id of the batch, None
+# once every user is done, and how many users and rows got recommendations
+def refresh_recommendations(
+        after_user_id: int = 0,
+        batch_size: int = 500,
+        per_user: int = 50,
+        category_weight: float = 0.5,
+        org_weight: float = 0.3,
+        popularity_weight: float = 0.2,
+):
+    conn = get_conn(query_class="maintenance")
+    cur = conn.cursor()
+
+    try:
+        cur.execute(
+            "SELECT user_id FROM users WHERE user_id > %s ORDER BY user_id LIMIT %s",
+            (after_user_id, batch_size),
+        )
+        user_ids = [row["user_id"] for row in cur.fetchall()]
+
+        if not user_ids:
+            conn.rollback()
+            return None, 0, 0
+
+        # readers keep seeing the batch's old feed until the new one commits.
+        # users without any history just lose theirs
+        cur.execute(
+            "DELETE FROM user_recommendations WHERE user_id = ANY (%s)", (user_ids,)
+        )
+
+        # every user of the batch with a signup history, archived signups
+        # included, gets the current opportunities they have not signed up for,
+        # scored by how much of their history shares the category and the org,
+        # plus how popular the opportunity is overall
+        cur.execute(
+            """
+            WITH history AS (SELECT sup.user_id, opp.category, opp.org_id
+                             FROM signup AS sup,
+                                  opportunities AS opp
+                             WHERE sup.opp_id = opp.opp_id
+                               AND sup.user_id = ANY (%(user_ids)s)
+                             UNION ALL
+                             SELECT sup.user_id, opp.category, opp.org_id
+                             FROM signup_archive AS sup,
+                                  opportunities_archive AS opp
+                             WHERE sup.opp_id = opp.opp_id
+                               AND sup.user_id = ANY (%(user_ids)s)),
+                 category_affinity AS (SELECT user_id,
+                                              category,
+                                              COUNT(*)::real / SUM(COUNT(*)) OVER (PARTITION BY user_id) AS affinity
+                                       FROM history
+                                       GROUP BY user_id, category),
+                 org_affinity AS (SELECT user_id,
+                                         org_id,
+                                         COUNT(*)::real / SUM(COUNT(*)) OVER (PARTITION BY user_id) AS affinity
+                                  FROM history
+                                  GROUP BY user_id, org_id),
+                 candidates AS (SELECT opp_id,
+                                       category,
+                                       org_id,
+                                       LN(1 + signup_count) / NULLIF(LN(1 + MAX(signup_count) OVER ()), 0) AS popularity
+                                FROM opportunities
+                                WHERE COALESCE(end_date, start_date) >= CURRENT_DATE),
+                 scored AS (SELECT users.user_id,
+                                   c.opp_id,
+                                   %(category_weight)s * COALESCE(ca.affinity, 0)
+                                       + %(org_weight)s * COALESCE(oa.affinity, 0)
+                                       + %(popularity_weight)s * COALESCE(c.popularity, 0) AS score
+                            FROM (SELECT DISTINCT user_id FROM history) AS users
+                                     CROSS JOIN candidates AS c
+                                     LEFT JOIN category_affinity AS ca
+                                               ON ca.user_id = users.user_id AND ca.category = c.category
+                                     LEFT JOIN org_affinity AS oa
+                                               ON oa.user_id = users.user_id AND oa.org_id = c.org_id
+                            WHERE NOT EXISTS (SELECT 1
+                                              FROM signup AS sup
+                                              WHERE sup.user_id = users.user_id
+                                                AND sup.opp_id = c.opp_id)),
+                 ranked AS (SELECT user_id,
+                                   opp_id,
+                                   score,
+                                   ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY score DESC, opp_id) AS rank
+                            FROM scored)
+            INSERT
+            INTO user_recommendations (user_id, rank, opp_id, score)
+            SELECT user_id, rank, opp_id, score
+            FROM ranked
+            WHERE rank <= %(per_user)s
+            RETURNING user_id
+            """,
+            {
+                "user_ids": user_ids,
+                "per_user": per_user,
+                "category_weight": category_weight,
+                "org_weight": org_weight,
+                "popularity_weight": popularity_weight,
+            },
+        )
+        recommended = [row["user_id"] for row in cur.fetchall()]
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        put_conn(conn)
+
+    return user_ids[-1], len(set(recommended)), len(recommended)
+
+
+def get_recommended_opportunities(user_id: int, limit: int, offset: int = 0):
+    conn = get_conn(read_only=True)
+    cur = conn.cursor()
+
+    # one range scan of the user's rows in user_recommendations
+    cur.execute(
+        """
+        SELECT opp.opp_id,
+               opp.title,
+               opp.opp_image_url,
+               opp.category,
+               opp.start_date,
+               opp.end_date,
+               opp.org_id,
+               org.org_name
+        FROM user_recommendations AS rec,
+             opportunities AS opp,
+             organizations AS org
+        WHERE rec.user_id = %s
+          AND opp.opp_id = rec.opp_id
+          AND org.org_id = opp.org_id
+          AND COALESCE(opp.end_date, opp.start_date) >= CURRENT_DATE
+          AND NOT EXISTS (SELECT 1
+                          FROM signup AS sup
+                          WHERE sup.user_id = rec.user_id
+                            AND sup.opp_id = rec.opp_id)
+        ORDER BY rec.rank
+        LIMIT %s OFFSET %s
+        """,
+        (user_id, limit, offset),
+    )
+    rows = cur.fetchall()
+
+    cur.close()
+    put_conn(conn)
+
+    return rows
+
+
+# fallback feed for users without precomputed recommendations yet
+def get_popular_opportunities(user_id: int, limit: int, offset: int = 0):
+    conn = get_conn(read_only=True)
+    cur = conn.cursor()
+
+    cur.execute(
+        """
+        SELECT opp.opp_id,
+               opp.title,
+               opp.opp_image_url,
+               opp.category,
+               opp.start_date,
+               opp.end_date,
+               opp.org_id,
+               org.org_name
+        FROM opportunities AS opp,
+             organizations AS org
+        WHERE org.org_id = opp.org_id
+          AND COALESCE(opp.end_date, opp.start_date) >= CURRENT_DATE
+          AND NOT EXISTS (SELECT 1
+                          FROM signup AS sup
+                          WHERE sup.user_id = %s
+                            AND sup.opp_id = opp.opp_id)
+        ORDER BY opp.signup_count DESC, opp.start_date, opp.opp_id
+        LIMIT %s OFFSET %s
+        """,
+        (user_id, limit, offset),
+    )
+    rows = cur.fetchall()
+
+    cur.close()
+    put_conn(conn)
+
+    return rows
+
+
+# ********************************
+# queries for archiving
+# ********************************
+def archive_ended_opportunities(ended_before, batch_size: int = 500):
+    conn = get_conn(query_class="maintenance")
+    cur = conn.cursor(cursor_factory=TupleCursor)
+
+    try:
+        # locked rows are skipped, so an opportunity being signed up for right
+        # now is left for the next batch instead of blocking the archiver
+        cur.execute(
+            """
+            SELECT opp_id
+            FROM opportunities
+            WHERE COALESCE(end_date, start_date) < %s
+            ORDER BY opp_id
+            LIMIT %s FOR UPDATE SKIP LOCKED
+            """,
+            (ended_before, batch_size),
+        )
+        opp_ids = [opp_id for opp_id, in cur.fetchall()]
+
+        user_ids = []
+        if opp_ids:
+            cur.execute(
+                """
+                INSERT INTO opportunities_archive (opp_id, title, opp_image_url, description, category, start_date,
+                                                   end_date, max_signups, signup_count, org_id)
+                SELECT opp_id,
+                       title,
+                       opp_image_url,
+                       description,
+                       category,
+                       start_date,
+                       end_date,
+                       max_signups,
+                       signup_count,
+                       org_id
+                FROM opportunities
+                WHERE opp_id = ANY (%s)
+                """,
+                (opp_ids,),
+            )
+
+            cur.execute(
+                """
+                INSERT INTO signup_archive (signup_id, user_id, opp_id, signup_date, status)
+                SELECT signup_id, user_id, opp_id, signup_date, status
+                FROM signup
+                WHERE opp_id = ANY (%s)
+                RETURNING user_id
+                """,
+                (opp_ids,),
+            )
+            user_ids = [user_id for user_id, in cur.fetchall()]
+
+            # removes their signups and recommendations through the cascades
+            cur.execute("DELETE FROM opportunities WHERE opp_id = ANY (%s)", (opp_ids,))
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        put_conn(conn)
+
+    for user_id in set(user_ids):
+        calendar_cache.invalidate(user_id)
+
+    return len(opp_ids), len(user_ids)
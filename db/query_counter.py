@@ -0,0 +1,42 @@
+from contextvars import ContextVar
+
+from psycopg2.extensions import cursor
+from psycopg2.extras import RealDictCursor
+
+# statements run during the current request, None when nobody is counting
+query_log = ContextVar("query_log", default=None)
+
+
+def start_counting() -> list:
+    log = []
+    query_log.set(log)
+    return log
+
+
+def stop_counting():
+    query_log.set(None)
+
+
+def query_count() -> int:
+    log = query_log.get()
+    return len(log) if log is not None else 0
+
+
+def record_query(query):
+    log = query_log.get()
+    if log is not None:
+        log.append(query)
+
+
+# cursors that record every statement they send, including the ones
+# execute_values and execute_prepared send for us
+class CountingCursor(cursor):
+    def execute(self, query, vars=None):
+        record_query(query)
+        return super().execute(query, vars)
+
+
+class CountingDictCursor(RealDictCursor):
+    def execute(self, query, vars=None):
+        record_query(query)
+        return super().execute(query, vars)
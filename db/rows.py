@@ -0,0 +1,57 @@
+from collections import namedtuple
+
+from .query_counter import CountingCursor as TupleCursor
+
+
+# builds a compact, immutable row type for a fixed column projection. rows
+# support both row.column and row["column"], so code written against the
+# RealDictCursor rows keeps working
+def make_row_type(name: str, columns: list):
+    base = namedtuple(name, columns)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+
+        return base.__getitem__(self, key)
+
+    return type(name, (base,), {"__slots__": (), "__getitem__": __getitem__})
+
+
+def fetchone_as(cur: TupleCursor, row_type):
+    row = cur.fetchone()
+
+    if row is None:
+        return None
+
+    return row_type._make(row)
+
+
+def fetchall_as(cur: TupleCursor, row_type):
+    return list(map(row_type._make, cur.fetchall()))
+
+
+# ********************************
+# row types
+# ********************************
+UserRow = make_row_type(
+    "UserRow",
+    ["user_id", "first_name", "last_name", "utd_net_id", "email", "role"],
+)
+
+# only used for logging in, the hash never leaves the login route
+UserCredentialsRow = make_row_type(
+    "UserCredentialsRow", ["user_id", "first_name", "password"]
+)
+
+OrgRow = make_row_type(
+    "OrgRow",
+    ["org_id", "org_name", "org_type", "org_email", "org_image_url", "org_rep_id"],
+)
+
+SignupRow = make_row_type(
+    "SignupRow", ["signup_id", "user_id", "opp_id", "signup_date", "status"]
+)
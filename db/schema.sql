@@ -0,0 +1,54 @@
+-- base tables the queries in db/queries.py run against. for a fresh database,
+-- load this first and then the files in db/migrations in order
+
+CREATE TABLE IF NOT EXISTS users
+(
+    user_id    serial PRIMARY KEY,
+    first_name text NOT NULL,
+    last_name  text NOT NULL,
+    utd_net_id text NOT NULL,
+    email      text NOT NULL,
+    password   text NOT NULL,
+    role       text NOT NULL DEFAULT 'student'
+);
+
+CREATE TABLE IF NOT EXISTS organizations
+(
+    org_id        serial PRIMARY KEY,
+    org_name      text    NOT NULL,
+    org_type      text    NOT NULL,
+    org_email     text    NOT NULL,
+    org_image_url text,
+    org_rep_id    integer NOT NULL REFERENCES users (user_id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS opportunities
+(
+    opp_id        serial PRIMARY KEY,
+    title         text    NOT NULL,
+    opp_image_url text,
+    description   text    NOT NULL,
+    category      text    NOT NULL,
+    start_date    date    NOT NULL,
+    end_date      date,
+    max_signups   integer,
+    org_id        integer NOT NULL REFERENCES organizations (org_id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS signup
+(
+    signup_id   serial PRIMARY KEY,
+    user_id     integer NOT NULL REFERENCES users (user_id) ON DELETE CASCADE,
+    opp_id      integer NOT NULL REFERENCES opportunities (opp_id) ON DELETE CASCADE,
+    signup_date date    NOT NULL DEFAULT CURRENT_DATE,
+    status      text    NOT NULL DEFAULT 'pending'
+);
+
+CREATE INDEX IF NOT EXISTS opportunities_org_id_idx
+    ON opportunities (org_id);
+
+CREATE INDEX IF NOT EXISTS signup_opp_id_idx
+    ON signup (opp_id);
+
+CREATE INDEX IF NOT EXISTS signup_user_id_idx
+    ON signup (user_id);
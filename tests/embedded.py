@@ -0,0 +1,25 @@
+import os
+import unittest
+
+from db.embedded import EmbeddedPostgres
+
+# the database tests run against a throwaway postgres, see db/embedded.py. they
+# are skipped where it can not start, without the postgres server binaries or
+# as root
+UNAVAILABLE_REASON = EmbeddedPostgres.unavailable_reason()
+
+requires_postgres = unittest.skipIf(UNAVAILABLE_REASON is not None, UNAVAILABLE_REASON)
+
+
+# importing db.connection starts the cluster, so test modules call this from
+# setUpModule instead of importing the app at the top
+def start_embedded_database():
+    if UNAVAILABLE_REASON is not None:
+        raise unittest.SkipTest(UNAVAILABLE_REASON)
+
+    os.environ["DATABASE_BACKEND"] = "embedded"
+    os.environ.setdefault("SECRET_KEY", "test")
+
+    import db.connection
+
+    return db.connection.embedded_postgres
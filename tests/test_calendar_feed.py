@@ -0,0 +1,49 @@
+import unittest
+from datetime import date
+from unittest import mock
+
+from utils import calendar_feed
+from utils.calendar_feed import build_calendar, render_events
+
+BASE_URL = "https://link.utdallas.edu/"
+
+
+def make_signup(signup_id: int, title: str = "Tournament", status: str = "pending"):
+    return {
+        "signup_id": signup_id,
+        "opp_id": signup_id + 100,
+        "title": title,
+        "org_name": "Chess Club",
+        "signup_date": date(2026, 9, 1),
+        "start_date": date(2026, 11, 1),
+        "end_date": None,
+        "status": status,
+    }
+
+
+class RenderEventsTest(unittest.TestCase):
+    def test_only_renders_events_that_changed(self):
+        signups = [make_signup(1), make_signup(2), make_signup(3)]
+        previous = render_events(signups, BASE_URL)
+
+        signups[1] = make_signup(2, title="Final round")
+        with mock.patch.object(
+                calendar_feed, "render_event", wraps=calendar_feed.render_event
+        ) as render_event:
+            events = render_events(signups, BASE_URL, previous)
+
+        render_event.assert_called_once_with(signups[1], BASE_URL)
+        self.assertEqual(build_calendar(events), build_calendar(render_events(signups, BASE_URL)))
+        self.assertIn("SUMMARY:Final round", build_calendar(events))
+
+    def test_drops_removed_and_hidden_signups(self):
+        previous = render_events([make_signup(1), make_signup(2)], BASE_URL)
+
+        events = render_events([make_signup(1, status="cancelled")], BASE_URL, previous)
+
+        self.assertEqual(events, {})
+        self.assertNotIn("BEGIN:VEVENT", build_calendar(events))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import re
+import unittest
+from datetime import date, timedelta
+
+import psycopg2
+from itsdangerous import URLSafeSerializer
+
+from tests.embedded import requires_postgres, start_embedded_database
+
+
+def setUpModule():
+    global app, embedded_postgres, use_database, make_calendar_token
+
+    embedded_postgres = start_embedded_database()
+    from app import app
+    from db.connection import use_database
+    from utils.calendar_feed import make_calendar_token
+
+
+@requires_postgres
+class CalendarFeedResetTest(unittest.TestCase):
+    def setUp(self):
+        dsn = embedded_postgres.create_database()
+        use_database(dsn)
+
+        conn = psycopg2.connect(dsn)
+        cur = conn.cursor()
+        for user_id in (1, 2):
+            cur.execute(
+                "INSERT INTO users (user_id, first_name, last_name, utd_net_id, email, password, role) VALUES (%s, 'Test', 'User', %s, %s, 'x', 'student')",
+                (user_id, f"tst{user_id:06}", f"user{user_id}@utdallas.edu"),
+            )
+        cur.execute(
+            "INSERT INTO organizations (org_id, org_name, org_type, org_email, org_rep_id) VALUES (1, 'Chess Club', 'student_org', 'chess@utdallas.edu', 2)"
+        )
+        cur.execute(
+            "INSERT INTO opportunities (opp_id, title, description, category, start_date, org_id) VALUES (1, 'Tournament', 'hello', 'career_fair', %s, 1)",
+            (date.today() + timedelta(days=7),),
+        )
+        for user_id in (1, 2):
+            cur.execute(
+                "INSERT INTO signup (user_id, opp_id, signup_date) VALUES (%s, 1, CURRENT_DATE)",
+                (user_id,),
+            )
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        app.testing = True
+        self.client = app.test_client()
+        with self.client.session_transaction() as session:
+            session["user_id"] = 1
+
+    def feed_path(self, response) -> str:
+        url = re.search(rb'href="(http[^"]+\.ics)"', response.data).group(1).decode()
+        return url.split("localhost", 1)[1]
+
+    def test_reset_revokes_only_the_old_link(self):
+        old_path = self.feed_path(self.client.get("/profile/tabs/signups"))
+        other_path = f"/calendar/{make_calendar_token(app.secret_key, 2, 1)}.ics"
+        self.assertEqual(self.client.get(old_path).status_code, 200)
+
+        response = self.client.post("/calendar/reset", headers={"HX-Request": "true"})
+        new_path = self.feed_path(response)
+
+        self.assertNotEqual(new_path, old_path)
+        self.assertEqual(self.client.get(old_path).status_code, 404)
+        self.assertEqual(self.client.get(new_path).status_code, 200)
+        self.assertEqual(self.client.get(other_path).status_code, 200)
+        self.assertEqual(self.client.get(old_path).status_code, 404)
+
+    def test_links_from_before_the_version_still_work(self):
+        token = URLSafeSerializer(app.secret_key, salt="calendar-feed").dumps(1)
+
+        self.assertEqual(self.client.get(f"/calendar/{token}.ics").status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import io
+import unittest
+from datetime import date, timedelta
+from unittest import mock
+
+from utils import csv_importer
+from utils.csv_importer import parse_opportunity_csv
+
+START_DATE = (date.today() + timedelta(days=7)).isoformat()
+
+
+def make_csv(image_url: str) -> io.BytesIO:
+    content = (
+        "title,category,description,start_date,image_url\n"
+        f"Tournament,career_fair,hello,{START_DATE},{image_url}\n"
+    )
+    return io.BytesIO(content.encode("utf-8"))
+
+
+class ParseOpportunityCsvTest(unittest.TestCase):
+    def test_accepts_https_image_urls(self):
+        opportunities, errors = parse_opportunity_csv(
+            make_csv("https://example.com/flyer.png")
+        )
+
+        self.assertEqual(errors, [])
+        self.assertEqual(opportunities[0]["opp_image_url"], "https://example.com/flyer.png")
+
+    def test_rejects_other_image_urls(self):
+        for image_url in (
+                "http://example.com/flyer.png",
+                "javascript:alert(1)",
+                "data:image/png;base64,AAAA",
+                "https:///flyer.png",
+        ):
+            opportunities, errors = parse_opportunity_csv(make_csv(image_url))
+
+            self.assertEqual(opportunities, [], image_url)
+            self.assertEqual(
+                errors, [{"row": 2, "messages": ["Image URL needs to be an https link"]}]
+            )
+
+    def test_rejects_files_over_the_limit_before_parsing(self):
+        csv_file = make_csv("")
+
+        with mock.patch.object(csv_importer, "OPPORTUNITY_CSV_MAX_BYTES", 10):
+            with mock.patch.object(csv_importer.csv, "DictReader") as reader:
+                opportunities, errors = parse_opportunity_csv(csv_file)
+
+        reader.assert_not_called()
+        self.assertEqual(opportunities, [])
+        self.assertEqual(
+            errors, [{"row": None, "messages": ["The file must not be larger than 0 KB"]}]
+        )
+        # no more than one byte past the limit is read
+        self.assertEqual(csv_file.tell(), 11)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+from unittest import mock
+
+from utils import image_uploader
+from utils.image_uploader import cloudinary_public_id, delete_uploaded_image
+
+UPLOADED_URL = "https://res.cloudinary.com/demo/image/upload/v1712345678/utd-link/abc123.png"
+
+
+class DeleteUploadedImageTest(unittest.TestCase):
+    def test_public_id_skips_version_and_extension(self):
+        self.assertEqual(cloudinary_public_id(UPLOADED_URL), "utd-link/abc123")
+        self.assertIsNone(cloudinary_public_id("https://example.com/logo.png"))
+        self.assertIsNone(cloudinary_public_id(""))
+
+    def test_destroys_uploaded_image(self):
+        with mock.patch.object(image_uploader.cloudinary.uploader, "destroy") as destroy:
+            delete_uploaded_image(UPLOADED_URL)
+
+        destroy.assert_called_once_with("utd-link/abc123", invalidate=True)
+
+    def test_leaves_other_urls_alone(self):
+        with mock.patch.object(image_uploader.cloudinary.uploader, "destroy") as destroy:
+            delete_uploaded_image("")
+            delete_uploaded_image("https://example.com/logo.png")
+
+        destroy.assert_not_called()
+
+    def test_failure_is_not_raised(self):
+        with mock.patch.object(
+                image_uploader.cloudinary.uploader, "destroy", side_effect=Exception("down")
+        ):
+            with self.assertLogs("utils.image_uploader", "WARNING"):
+                delete_uploaded_image(UPLOADED_URL)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+from datetime import date, timedelta
+
+import psycopg2
+
+from tests.embedded import requires_postgres, start_embedded_database
+
+
+def setUpModule():
+    global app, embedded_postgres, use_database, refresh_recommendations
+
+    embedded_postgres = start_embedded_database()
+    from app import app
+    from db.connection import use_database
+    from db.queries import refresh_recommendations
+
+
+@requires_postgres
+class RefreshRecommendationsTest(unittest.TestCase):
+    def setUp(self):
+        self.dsn = embedded_postgres.create_database()
+        use_database(self.dsn)
+
+        for user_id in (1, 2, 3, 4):
+            self.execute(
+                "INSERT INTO users (user_id, first_name, last_name, utd_net_id, email, password, role) VALUES (%s, 'Test', 'User', %s, %s, 'x', 'student')",
+                (user_id, f"tst{user_id:06}", f"user{user_id}@utdallas.edu"),
+            )
+        self.execute(
+            "INSERT INTO organizations (org_id, org_name, org_type, org_email, org_rep_id) VALUES (1, 'Chess Club', 'student_org', 'chess@utdallas.edu', 4)"
+        )
+        for opp_id in (1, 2, 3):
+            self.execute(
+                "INSERT INTO opportunities (opp_id, title, description, category, start_date, org_id) VALUES (%s, %s, 'hello', 'career_fair', %s, 1)",
+                (opp_id, f"Event {opp_id}", date.today() + timedelta(days=7)),
+            )
+
+        # users 1 to 3 have a history, user 4 only an outdated feed
+        for user_id in (1, 2, 3):
+            self.execute(
+                "INSERT INTO signup (user_id, opp_id, signup_date) VALUES (%s, %s, CURRENT_DATE)",
+                (user_id, user_id),
+            )
+        self.execute(
+            "INSERT INTO user_recommendations (user_id, rank, opp_id, score) VALUES (4, 1, 1, 1)"
+        )
+
+    def execute(self, sql: str, params=()):
+        conn = psycopg2.connect(self.dsn)
+        try:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            rows = cur.fetchall() if cur.description else None
+            conn.commit()
+            cur.close()
+        finally:
+            conn.close()
+
+        return rows
+
+    def recommendations(self):
+        return self.execute(
+            "SELECT user_id, rank, opp_id FROM user_recommendations ORDER BY user_id, rank"
+        )
+
+    def test_batch_only_replaces_its_own_users(self):
+        self.execute(
+            "INSERT INTO user_recommendations (user_id, rank, opp_id, score) VALUES (3, 1, 3, 1)"
+        )
+
+        self.assertEqual(refresh_recommendations(0, 2), (2, 2, 4))
+
+        self.assertEqual(
+            self.recommendations(),
+            [(1, 1, 2), (1, 2, 3), (2, 1, 1), (2, 2, 3), (3, 1, 3), (4, 1, 1)],
+        )
+
+    def test_batches_cover_every_user(self):
+        result = app.test_cli_runner().invoke(
+            args=["refresh-recommendations", "--batch-size", "1", "--pause", "0"]
+        )
+
+        self.assertIn("stored 6 recommendations for 3 users", result.output)
+        self.assertEqual(
+            self.recommendations(),
+            [(1, 1, 2), (1, 2, 3), (2, 1, 1), (2, 2, 3), (3, 1, 1), (3, 2, 2)],
+        )
+        self.assertIsNone(refresh_recommendations(4, 1)[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
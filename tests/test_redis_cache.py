@@ -0,0 +1,88 @@
+import time
+import unittest
+
+import fakeredis
+
+from utils.cache import INVALIDATION_CHANNEL, MISSING, RedisCache
+
+
+# two workers sharing one redis server, each with its own local copy
+class RedisCacheTest(unittest.TestCase):
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        self.first = RedisCache(
+            fakeredis.FakeRedis(server=server), "test", ttl=60, near_ttl=60
+        )
+        self.second = RedisCache(
+            fakeredis.FakeRedis(server=server), "test", ttl=60, near_ttl=60
+        )
+
+    def wait_for(self, condition, timeout: float = 2):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("timed out")
+            time.sleep(0.01)
+
+    # both workers hold a local copy and listen for invalidations
+    def cache_in_both(self, scope, value, key=None):
+        self.first.set(scope, value, key)
+        self.assertEqual(self.second.get(scope, key), value)
+
+        client = self.second.client
+        self.wait_for(
+            lambda: client.pubsub_numsub(INVALIDATION_CHANNEL)[0][1] >= 1
+        )
+
+        # subscribing drops the local copies, so take one again
+        self.assertEqual(self.second.get(scope, key), value)
+        self.assertEqual(self.second.near.get(str(scope), key), value)
+
+    def test_entries_are_shared(self):
+        self.first.set(1, {"body": "feed"}, key="a")
+
+        self.assertEqual(self.second.get(1, key="a"), {"body": "feed"})
+        self.assertIs(self.second.get(1, key="b"), MISSING)
+        self.assertIs(self.second.get(2, key="a"), MISSING)
+
+    def test_invalidation_reaches_the_other_worker(self):
+        self.cache_in_both(1, "old")
+        self.cache_in_both(2, "kept")
+
+        self.first.invalidate(1)
+
+        self.wait_for(lambda: self.second.near.get("1") is MISSING)
+        self.assertIs(self.second.get(1), MISSING)
+        self.assertEqual(self.second.get(2), "kept")
+        self.assertEqual(self.first.stats()["invalidations"], 1)
+
+    def test_clear_reaches_the_other_worker(self):
+        self.cache_in_both(1, "old")
+
+        self.first.clear()
+
+        self.wait_for(lambda: self.second.near.get("1") is MISSING)
+        self.assertIs(self.second.get(1), MISSING)
+
+    def test_other_caches_are_left_alone(self):
+        other = RedisCache(self.first.client, "other", ttl=60)
+        other.set(1, "other")
+        self.cache_in_both(1, "test")
+
+        other.invalidate(1)
+
+        self.assertIs(other.get(1), MISSING)
+        time.sleep(0.1)
+        self.assertEqual(self.second.near.get("1"), "test")
+
+    def test_expired_entries_are_missing(self):
+        cache = RedisCache(self.first.client, "short", ttl=0.05)
+        cache.set(1, "value")
+
+        self.assertEqual(cache.get(1), "value")
+        time.sleep(0.1)
+        self.assertIs(cache.get(1), MISSING)
+
+
+if __name__ == "__main__":
+    unittest.main()
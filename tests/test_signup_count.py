@@ -0,0 +1,93 @@
+import unittest
+from datetime import date, timedelta
+
+import psycopg2
+
+from tests.embedded import requires_postgres, start_embedded_database
+
+
+def setUpModule():
+    global embedded_postgres, use_database
+    global create_new_signup, reconcile_signup_counts, update_signup_status_for_org
+
+    embedded_postgres = start_embedded_database()
+    from db.connection import use_database
+    from db.queries import (
+        create_new_signup,
+        reconcile_signup_counts,
+        update_signup_status_for_org,
+    )
+
+
+# rejected and cancelled signups give their place back
+@requires_postgres
+class SignupCountTest(unittest.TestCase):
+    def setUp(self):
+        self.dsn = embedded_postgres.create_database()
+        use_database(self.dsn)
+
+        for user_id in (1, 2, 3):
+            self.execute(
+                "INSERT INTO users (user_id, first_name, last_name, utd_net_id, email, password, role) VALUES (%s, 'Test', 'User', %s, %s, 'x', 'student')",
+                (user_id, f"tst{user_id:06}", f"user{user_id}@utdallas.edu"),
+            )
+        self.execute(
+            "INSERT INTO organizations (org_id, org_name, org_type, org_email, org_rep_id) VALUES (1, 'Chess Club', 'student_org', 'chess@utdallas.edu', 3)"
+        )
+        self.execute(
+            "INSERT INTO opportunities (opp_id, title, description, category, start_date, max_signups, org_id) VALUES (1, 'Tournament', 'hello', 'career_fair', %s, 1, 1)",
+            (date.today() + timedelta(days=7),),
+        )
+
+    def execute(self, sql: str, params=()):
+        conn = psycopg2.connect(self.dsn)
+        try:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            row = cur.fetchone() if cur.description else None
+            conn.commit()
+            cur.close()
+        finally:
+            conn.close()
+
+        return row
+
+    def signup_count(self):
+        return self.execute("SELECT signup_count FROM opportunities WHERE opp_id = 1")[0]
+
+    def set_status(self, user_id: int, status: str):
+        signup_id = self.execute(
+            "SELECT signup_id FROM signup WHERE user_id = %s", (user_id,)
+        )[0]
+        update_signup_status_for_org(1, [signup_id], status)
+
+    def test_rejecting_frees_the_place(self):
+        self.assertEqual(create_new_signup(1, 1), "success")
+        self.assertEqual(create_new_signup(2, 1), "full")
+
+        self.set_status(1, "rejected")
+
+        self.assertEqual(self.signup_count(), 0)
+        self.assertEqual(create_new_signup(2, 1), "success")
+        self.assertEqual(self.signup_count(), 1)
+
+    def test_moving_back_from_cancelled_takes_the_place_again(self):
+        create_new_signup(1, 1)
+        self.set_status(1, "cancelled")
+        self.assertEqual(self.signup_count(), 0)
+
+        self.set_status(1, "approved")
+        self.assertEqual(self.signup_count(), 1)
+
+        self.set_status(1, "attended")
+        self.assertEqual(self.signup_count(), 1)
+
+    def test_reconcile_leaves_rejected_signups_out(self):
+        create_new_signup(1, 1)
+        self.set_status(1, "rejected")
+
+        self.assertEqual(reconcile_signup_counts(repair=False), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+from unittest import mock
+
+from tests.embedded import requires_postgres, start_embedded_database
+from utils.cache import LocalCache
+
+
+def setUpModule():
+    global SignupQueue, signup_queue_module
+
+    start_embedded_database()
+    import utils.signup_queue as signup_queue_module
+    from utils.signup_queue import SignupQueue
+
+
+@requires_postgres
+class SignupQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.results = LocalCache(60)
+        self.queue = self.make_queue()
+
+    def make_queue(self):
+        signup_queue = SignupQueue(
+            maxsize=10, batch_size=10, batch_wait=0.05, results=self.results
+        )
+        # batches are processed by the test instead of a worker thread
+        signup_queue._ensure_worker = lambda: None
+        return signup_queue
+
+    def process(self, batch_insert):
+        with mock.patch.object(
+                signup_queue_module, "create_new_signups_batch", side_effect=batch_insert
+        ) as create_new_signups_batch:
+            self.queue._process(self.queue._next_batch())
+
+        return create_new_signups_batch
+
+    # a second worker process sharing the cache backend
+    def test_another_process_can_answer_for_a_ticket(self):
+        ticket = self.queue.enqueue(1, 2)
+        other_process = self.make_queue()
+
+        self.assertEqual(other_process.get_result(ticket)["status"], "pending")
+
+        self.process(lambda signup_requests: ["success"] * len(signup_requests))
+
+        self.assertEqual(
+            other_process.get_result(ticket),
+            {"user_id": 1, "opp_id": 2, "status": "success"},
+        )
+
+    def test_one_bad_request_does_not_fail_the_batch(self):
+        tickets = [self.queue.enqueue(user_id, 2) for user_id in (1, 2, 3)]
+
+        def batch_insert(signup_requests):
+            if (2, 2) in signup_requests:
+                raise Exception("duplicate key value violates unique constraint")
+
+            return ["success"] * len(signup_requests)
+
+        create_new_signups_batch = self.process(batch_insert)
+
+        self.assertEqual(
+            [self.queue.get_result(ticket)["status"] for ticket in tickets],
+            ["success", "error", "success"],
+        )
+        # the whole batch once, then every request on its own
+        self.assertEqual(create_new_signups_batch.call_count, 4)
+
+    def test_unknown_ticket(self):
+        self.assertIsNone(self.queue.get_result("missing"))
+
+
+if __name__ == "__main__":
+    unittest.main()
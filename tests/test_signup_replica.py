@@ -0,0 +1,127 @@
+import unittest
+from datetime import date, timedelta
+
+import psycopg2
+
+from tests.embedded import requires_postgres, start_embedded_database
+
+
+def setUpModule():
+    global app, embedded_postgres, use_database
+    global create_new_signup, get_signup_by_user_and_opp
+
+    embedded_postgres = start_embedded_database()
+    from app import app
+    from db.connection import use_database
+    from db.queries import create_new_signup, get_signup_by_user_and_opp
+
+
+def execute(dsn: str, sql: str, params=()):
+    conn = psycopg2.connect(dsn)
+    try:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        row = cur.fetchone() if cur.description else None
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+
+    return row
+
+
+# the replica is a separate database that never sees the signups made on the
+# primary, i.e. a replica lagging behind forever
+@requires_postgres
+class SignupWithStaleReplicaTest(unittest.TestCase):
+    def setUp(self):
+        self.primary = embedded_postgres.create_database()
+        self.replica = embedded_postgres.create_database()
+        use_database(self.primary, replica_dsn=self.replica)
+
+        for dsn in (self.primary, self.replica):
+            for user_id in (1, 2):
+                execute(
+                    dsn,
+                    "INSERT INTO users (user_id, first_name, last_name, utd_net_id, email, password, role) VALUES (%s, 'Test', 'User', %s, %s, 'x', 'student')",
+                    (user_id, f"tst{user_id:06}", f"user{user_id}@utdallas.edu"),
+                )
+            execute(
+                dsn,
+                "INSERT INTO organizations (org_id, org_name, org_type, org_email, org_rep_id) VALUES (1, 'Chess Club', 'student_org', 'chess@utdallas.edu', 2)",
+            )
+            execute(
+                dsn,
+                "INSERT INTO opportunities (opp_id, title, description, category, start_date, max_signups, org_id) VALUES (1, 'Tournament', 'hello', 'career_fair', %s, 2, 1)",
+                (date.today() + timedelta(days=7),),
+            )
+
+        app.testing = True
+        self.client = app.test_client()
+        with self.client.session_transaction() as session:
+            session["user_id"] = 1
+
+    def signup_on_primary(self, user_id: int):
+        execute(
+            self.primary,
+            "INSERT INTO signup (user_id, opp_id, signup_date) VALUES (%s, 1, CURRENT_DATE)",
+            (user_id,),
+        )
+
+    def signup_count(self):
+        return execute(self.primary, "SELECT COUNT(*) FROM signup WHERE opp_id = 1")[0]
+
+    def post_signup(self):
+        return self.client.post("/signup/1", headers={"HX-Request": "true"})
+
+    def test_refuses_duplicate_the_replica_has_not_seen(self):
+        self.signup_on_primary(1)
+
+        response = self.post_signup()
+
+        self.assertIn("already registered", response.headers["HX-Trigger"])
+        self.assertEqual(self.signup_count(), 1)
+
+    def test_refuses_full_opportunity_the_replica_has_not_seen(self):
+        execute(self.primary, "UPDATE opportunities SET max_signups = 1 WHERE opp_id = 1")
+        self.signup_on_primary(2)
+
+        response = self.post_signup()
+
+        self.assertIn("maximum signup capacity", response.headers["HX-Trigger"])
+        self.assertEqual(self.signup_count(), 1)
+
+    def test_signs_up_when_there_is_room(self):
+        response = self.post_signup()
+
+        self.assertIn("Signed up successfully", response.headers["HX-Trigger"])
+        self.assertEqual(self.signup_count(), 1)
+
+    def test_checks_before_a_write_read_the_primary(self):
+        self.signup_on_primary(1)
+
+        with app.test_request_context("/signup/1", method="POST"):
+            app.preprocess_request()
+            self.assertTrue(get_signup_by_user_and_opp(1, 1))
+
+        with app.test_request_context("/opportunity/1"):
+            app.preprocess_request()
+            self.assertFalse(get_signup_by_user_and_opp(1, 1))
+
+    # signups racing past the checks in the route
+    def test_insert_repeats_the_checks(self):
+        execute(self.primary, "UPDATE opportunities SET max_signups = 3 WHERE opp_id = 1")
+        self.signup_on_primary(2)
+
+        self.assertEqual(create_new_signup(2, 1), "already_registered")
+        self.assertEqual(create_new_signup(1, 1), "success")
+        self.assertEqual(create_new_signup(1, 1), "already_registered")
+
+        execute(self.primary, "DELETE FROM signup WHERE user_id = 1")
+        execute(self.primary, "UPDATE opportunities SET max_signups = 1 WHERE opp_id = 1")
+        self.assertEqual(create_new_signup(1, 1), "full")
+        self.assertEqual(self.signup_count(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+
+from tests.embedded import requires_postgres, start_embedded_database
+from utils.auth_cache import representative_cache
+from utils.cache import MISSING
+from utils.calendar_feed import calendar_cache
+from utils.org_cache import org_type_counts_cache
+
+
+def setUpModule():
+    global embedded_postgres, use_database
+
+    embedded_postgres = start_embedded_database()
+    from db.connection import use_database
+
+
+@requires_postgres
+class UseDatabaseTest(unittest.TestCase):
+    def test_drops_what_was_cached_from_the_old_database(self):
+        use_database(embedded_postgres.create_database())
+        representative_cache.set(1, True, key=1)
+        calendar_cache.set(1, {"body": ""})
+        org_type_counts_cache.set("all", {"student_org": 1})
+
+        use_database(embedded_postgres.create_database())
+
+        self.assertIs(representative_cache.get(1, key=1), MISSING)
+        self.assertIs(calendar_cache.get(1), MISSING)
+        self.assertIs(org_type_counts_cache.get("all"), MISSING)
+
+
+if __name__ == "__main__":
+    unittest.main()
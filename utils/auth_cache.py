@@ -0,0 +1,8 @@
+import os
+
+from utils.cache import MISSING, make_cache
+
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "30"))
+
+# (org_id, user_id) -> whether the user represents the org
+representative_cache = make_cache("representative", AUTH_CACHE_TTL)
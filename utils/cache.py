@@ -0,0 +1,264 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+# local: one cache per worker process. redis: one cache shared by every worker
+# through CACHE_REDIS_URL, with a small local copy in front of it
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "local").lower()
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+# how long a worker keeps its local copy of a shared entry, 0 turns it off
+CACHE_NEAR_TTL = float(os.getenv("CACHE_NEAR_TTL", "5"))
+
+CACHE_NAMESPACE = "utd-link:cache"
+INVALIDATION_CHANNEL = f"{CACHE_NAMESPACE}:invalidate"
+
+
+# every backend has the same interface. entries are grouped by scope (e.g. an
+# org id) under an optional key, so everything cached for a scope can be
+# dropped at once when it changes. get returns MISSING for absent entries
+#
+#   get(scope, key=None)
+#   set(scope, value, key=None)
+#   invalidate(scope)
+#   clear()
+#   stats()
+
+
+# in-process ttl cache. scopes are evicted least recently used first once
+# there are max_scopes of them
+class LocalCache:
+    def __init__(self, ttl: float, max_scopes: int = 10000):
+        self.ttl = ttl
+        self.max_scopes = max_scopes
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, scope, key=None):
+        now = time.monotonic()
+
+        with self._lock:
+            entries = self._entries.get(scope)
+            entry = entries.get(key) if entries is not None else None
+
+            if entry is None or entry[1] <= now:
+                self.misses += 1
+                return MISSING
+
+            self._entries.move_to_end(scope)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, scope, value, key=None):
+        expires_at = time.monotonic() + self.ttl
+
+        with self._lock:
+            if scope not in self._entries and len(self._entries) >= self.max_scopes:
+                self._entries.popitem(last=False)
+
+            self._entries.setdefault(scope, {})[key] = (value, expires_at)
+            self._entries.move_to_end(scope)
+
+    def invalidate(self, scope):
+        with self._lock:
+            if self._entries.pop(scope, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {
+                "backend": "local",
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "scopes": len(self._entries),
+            }
+
+
+# cache shared by all workers through any server speaking the redis protocol.
+# each scope is one redis hash that expires with its newest entry. values are
+# stored as json, so they have to be json serializable. invalidations are
+# published on a channel, and every worker drops its local copy of the scope
+# when it hears one
+class RedisCache:
+    def __init__(self, client, name: str, ttl: float, near_ttl: float = 0):
+        self.client = client
+        self.name = name
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        self.near = LocalCache(near_ttl) if near_ttl > 0 else None
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def _redis_key(self, scope) -> str:
+        return f"{CACHE_NAMESPACE}:{self.name}:{scope}"
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, scope, key=None):
+        scope = str(scope)
+
+        if self.near is not None:
+            self._ensure_listener()
+
+            value = self.near.get(scope, key)
+            if value is not MISSING:
+                self._count(True)
+                return value
+
+        raw = self.client.hget(self._redis_key(scope), json.dumps(key))
+        if raw is None:
+            self._count(False)
+            return MISSING
+
+        value, expires_at = json.loads(raw)
+        if expires_at <= time.time():
+            self._count(False)
+            return MISSING
+
+        if self.near is not None:
+            self.near.set(scope, value, key)
+
+        self._count(True)
+        return value
+
+    def set(self, scope, value, key=None):
+        scope = str(scope)
+        redis_key = self._redis_key(scope)
+
+        pipe = self.client.pipeline()
+        pipe.hset(
+            redis_key, json.dumps(key), json.dumps([value, time.time() + self.ttl])
+        )
+        pipe.expire(redis_key, max(int(self.ttl), 1))
+        pipe.execute()
+
+        if self.near is not None:
+            self.near.set(scope, value, key)
+
+    def invalidate(self, scope):
+        scope = str(scope)
+
+        if self.near is not None:
+            self.near.invalidate(scope)
+
+        pipe = self.client.pipeline()
+        pipe.delete(self._redis_key(scope))
+        pipe.publish(INVALIDATION_CHANNEL, f"{self.name}:{scope}")
+        deleted, _ = pipe.execute()
+
+        if deleted:
+            with self._lock:
+                self.invalidations += 1
+
+    def clear(self):
+        for redis_key in self.client.scan_iter(f"{CACHE_NAMESPACE}:{self.name}:*"):
+            self.client.delete(redis_key)
+
+        if self.near is not None:
+            self.near.clear()
+
+        self.client.publish(INVALIDATION_CHANNEL, f"{self.name}:*")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {
+                "backend": "redis",
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "near": self.near.stats() if self.near is not None else None,
+            }
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(
+                    target=self._listen, name=f"cache-{self.name}", daemon=True
+                )
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+
+                # anything published while we were not subscribed was missed
+                self.near.clear()
+
+                for message in pubsub.listen():
+                    data = message["data"]
+                    if isinstance(data, bytes):
+                        data = data.decode("utf-8")
+
+                    name, _, scope = data.partition(":")
+                    if name != self.name:
+                        continue
+
+                    if scope == "*":
+                        self.near.clear()
+                    else:
+                        self.near.invalidate(scope)
+            except Exception:
+                time.sleep(1)
+
+
+_redis_client = None
+
+# name -> every cache make_cache has handed out
+caches = {}
+
+
+# near_ttl overrides CACHE_NEAR_TTL, 0 makes every get read the shared entry
+def make_cache(name: str, ttl: float, max_scopes: int = 10000, near_ttl: float = None):
+    global _redis_client
+
+    if CACHE_BACKEND != "redis":
+        cache = LocalCache(ttl, max_scopes)
+    else:
+        if _redis_client is None:
+            import redis
+
+            _redis_client = redis.Redis.from_url(CACHE_REDIS_URL)
+
+        if near_ttl is None:
+            near_ttl = CACHE_NEAR_TTL
+
+        cache = RedisCache(_redis_client, name, ttl, near_ttl=min(near_ttl, ttl))
+
+    caches[name] = cache
+    return cache
+
+
+# e.g. when the app is pointed at another database, nothing cached from the
+# old one may be served
+def clear_caches():
+    for cache in caches.values():
+        cache.clear()
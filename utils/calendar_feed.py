@@ -0,0 +1,176 @@
+import hashlib
+import os
+import time
+from datetime import timedelta
+
+from itsdangerous import BadSignature, URLSafeSerializer
+
+from utils.cache import MISSING, make_cache
+
+# a user's rendered feed is kept until their signups change, or this many
+# seconds at most so edits to the opportunities themselves show up too
+CALENDAR_CACHE_TTL = float(os.getenv("CALENDAR_CACHE_TTL", "900"))
+
+# user_id -> {"body", "etag", "last_modified", "version"} of the user's rendered
+# feed, version being the link version it was rendered for
+calendar_cache = make_cache("calendar_feed", CALENDAR_CACHE_TTL)
+
+# how long the rendered events of a user's last feed are kept to rebuild the
+# next one from. they outlive the feed, which is dropped on every signup change
+CALENDAR_EVENTS_TTL = float(os.getenv("CALENDAR_EVENTS_TTL", "86400"))
+
+# user_id -> {signup_id: [fingerprint, rendered VEVENT]} of the user's last
+# rendered feed. a rebuild only renders the events whose signup or opportunity
+# changed since and reuses the rest
+calendar_events_cache = make_cache("calendar_events", CALENDAR_EVENTS_TTL)
+
+# signups in these states are left out of the feed
+HIDDEN_STATUSES = {"rejected", "cancelled"}
+
+
+def _serializer(secret_key: str) -> URLSafeSerializer:
+    return URLSafeSerializer(secret_key, salt="calendar-feed")
+
+
+# the token names the user and the version of their feed link, see
+# users.calendar_feed_version. it has to match for the feed to be served
+def make_calendar_token(secret_key: str, user_id: int, version: int) -> str:
+    return _serializer(secret_key).dumps([user_id, version])
+
+
+# (user_id, version), or None for a token that was not signed by us
+def load_calendar_token(secret_key: str, token: str):
+    try:
+        payload = _serializer(secret_key).loads(token)
+    except BadSignature:
+        return None
+
+    # links made before the version existed only carry the user id
+    if isinstance(payload, int):
+        return payload, 1
+
+    user_id, version = payload
+    return user_id, version
+
+
+def _escape(text: str) -> str:
+    return (
+        str(text)
+        .replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+# content lines are folded at 75 octets, continuation lines start with a space
+def _fold(line: str) -> str:
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line
+
+    parts = []
+    while encoded:
+        limit = 75 if not parts else 74
+        cut = min(limit, len(encoded))
+
+        # never split a multi-byte character
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+
+        parts.append(encoded[:cut].decode("utf-8"))
+        encoded = encoded[cut:]
+
+    return "\r\n ".join(parts)
+
+
+def _lines(lines: list) -> str:
+    return "".join(_fold(line) + "\r\n" for line in lines)
+
+
+# everything a rendered event depends on
+def _fingerprint(signup, base_url: str) -> str:
+    fields = (
+        signup["opp_id"],
+        signup["title"],
+        signup["org_name"],
+        signup["signup_date"],
+        signup["start_date"],
+        signup["end_date"],
+        base_url,
+    )
+    return hashlib.sha1(repr(fields).encode("utf-8")).hexdigest()
+
+
+def render_event(signup, base_url: str) -> str:
+    # all-day events, DTEND is exclusive
+    end_date = signup["end_date"] or signup["start_date"]
+
+    return _lines(
+        [
+            "BEGIN:VEVENT",
+            f"UID:signup-{signup['signup_id']}@utd-link",
+            # the signup date keeps the feed byte-identical between rebuilds
+            f"DTSTAMP:{signup['signup_date']:%Y%m%d}T000000Z",
+            f"DTSTART;VALUE=DATE:{signup['start_date']:%Y%m%d}",
+            f"DTEND;VALUE=DATE:{end_date + timedelta(days=1):%Y%m%d}",
+            f"SUMMARY:{_escape(signup['title'])}",
+            f"DESCRIPTION:{_escape('Hosted by ' + signup['org_name'])}",
+            f"URL:{base_url}opportunity/{signup['opp_id']}",
+            "END:VEVENT",
+        ]
+    )
+
+
+# signup_id -> [fingerprint, rendered event] for the visible signups, reusing
+# the events of previous whose fingerprint has not changed. the ids are strings
+# so the map survives the json round trip of the redis cache
+def render_events(signups: list, base_url: str, previous: dict = None) -> dict:
+    previous = previous or {}
+    events = {}
+
+    for signup in signups:
+        if signup["status"] in HIDDEN_STATUSES:
+            continue
+
+        signup_id = str(signup["signup_id"])
+        fingerprint = _fingerprint(signup, base_url)
+
+        cached = previous.get(signup_id)
+        if cached is not None and cached[0] == fingerprint:
+            events[signup_id] = cached
+        else:
+            events[signup_id] = [fingerprint, render_event(signup, base_url)]
+
+    return events
+
+
+def build_calendar(events: dict) -> str:
+    header = _lines(
+        [
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            "PRODID:-//UTD Link//Signups//EN",
+            "CALSCALE:GREGORIAN",
+            "X-WR-CALNAME:UTD Link signups",
+        ]
+    )
+    body = "".join(event for _, event in events.values())
+
+    return header + body + _lines(["END:VCALENDAR"])
+
+
+def render_feed(user_id: int, version: int, signups: list, base_url: str) -> dict:
+    previous = calendar_events_cache.get(user_id)
+    events = render_events(signups, base_url, None if previous is MISSING else previous)
+    calendar_events_cache.set(user_id, events)
+
+    body = build_calendar(events)
+
+    return {
+        "body": body,
+        "etag": hashlib.sha1(body.encode("utf-8")).hexdigest(),
+        "last_modified": time.time(),
+        "version": version,
+    }
@@ -0,0 +1,141 @@
+import json
+import queue
+import select
+import threading
+import time
+
+import psycopg2
+
+import db.connection
+from db.connection import read_from_primary
+from db.queries import get_opportunities_capacity
+
+SIGNUP_CHANGES_CHANNEL = "signup_changes"
+
+# how often the listener wakes up without a notify, to notice the app was
+# pointed at another database
+LISTEN_POLL_SECONDS = 5
+
+
+def capacity_event(capacity) -> str:
+    max_signups = capacity["max_signups"]
+    signup_count = int(capacity["signup_count"])
+
+    data = {
+        "opp_id": capacity["opp_id"],
+        "max_signups": max_signups,
+        "signup_count": signup_count,
+        "remaining": max(max_signups - signup_count, 0) if max_signups else None,
+    }
+
+    return f"event: capacity\ndata: {json.dumps(data)}\n\n"
+
+
+# one LISTEN connection per process. signup changes are fanned out to the
+# server-sent event streams watching each opportunity, so the number of
+# browsers watching does not change the number of db connections. without a
+# dsn it listens on whatever database the pools currently use
+class CapacityBroadcaster:
+    def __init__(self, dsn: str = None):
+        self.dsn = dsn
+
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def subscribe(self, opp_id: int):
+        updates = queue.Queue(maxsize=10)
+
+        with self._lock:
+            self._subscribers.setdefault(opp_id, set()).add(updates)
+
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(
+                    target=self._run, name="capacity-listener", daemon=True
+                )
+                self._listener.start()
+
+        return updates
+
+    def unsubscribe(self, opp_id: int, updates: queue.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(opp_id)
+
+            if subscribers is not None:
+                subscribers.discard(updates)
+                if not subscribers:
+                    del self._subscribers[opp_id]
+
+    def _watched(self, opp_ids=None):
+        with self._lock:
+            if opp_ids is None:
+                return list(self._subscribers)
+
+            return [opp_id for opp_id in opp_ids if opp_id in self._subscribers]
+
+    def _publish(self, opp_ids: list):
+        if not opp_ids:
+            return
+
+        for capacity in get_opportunities_capacity(opp_ids):
+            event = capacity_event(capacity)
+
+            with self._lock:
+                subscribers = list(self._subscribers.get(capacity["opp_id"], ()))
+
+            for updates in subscribers:
+                # a slow browser only needs the latest value, drop its oldest one
+                try:
+                    updates.put_nowait(event)
+                except queue.Full:
+                    try:
+                        updates.get_nowait()
+                        updates.put_nowait(event)
+                    except (queue.Empty, queue.Full):
+                        pass
+
+    def _run(self):
+        # a notify means the primary just changed, the replica may not have it yet
+        read_from_primary.set(True)
+
+        while True:
+            try:
+                self._listen()
+            except Exception:
+                time.sleep(1)
+
+    def _current_dsn(self) -> str:
+        return self.dsn or db.connection.database_url
+
+    def _listen(self):
+        dsn = self._current_dsn()
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = True
+
+        try:
+            cur = conn.cursor()
+            cur.execute(f"LISTEN {SIGNUP_CHANGES_CHANNEL}")
+
+            # changes made while we were not listening were missed, resend everything
+            self._publish(self._watched())
+
+            # use_database() switched databases, listen on the new one
+            while self._current_dsn() == dsn:
+                if select.select([conn], [], [], LISTEN_POLL_SECONDS) == ([], [], []):
+                    continue
+
+                conn.poll()
+
+                # several signups in a burst only need one capacity query
+                opp_ids = set()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    if notify.payload.isdigit():
+                        opp_ids.add(int(notify.payload))
+
+                self._publish(self._watched(opp_ids))
+        finally:
+            conn.close()
+
+
+capacity_broadcaster = CapacityBroadcaster()
@@ -0,0 +1,163 @@
+import csv
+import io
+import os
+
+from markupsafe import escape
+
+from utils.validator import (
+    validate_not_empty,
+    validate_category,
+    validate_description,
+    validate_date,
+    validate_start_end_dates,
+    validate_max_signups,
+    validate_https_url,
+    compare_date_with_today,
+)
+
+# bigger files are turned down before any of them is parsed
+OPPORTUNITY_CSV_MAX_BYTES = int(os.getenv("OPPORTUNITY_CSV_MAX_BYTES", "1048576"))
+
+OPPORTUNITY_CSV_COLUMNS = [
+    "title",
+    "category",
+    "description",
+    "start_date",
+    "end_date",
+    "max_signups",
+    "image_url",
+]
+
+REQUIRED_OPPORTUNITY_CSV_COLUMNS = ["title", "category", "description", "start_date"]
+
+
+def validate_opportunity_row(row: dict) -> list:
+    errors = []
+
+    title = row["title"]
+    category = row["category"]
+    description = row["description"]
+    start_date = row["start_date"]
+    end_date = row["end_date"]
+    max_signups = row["max_signups"]
+    image_url = row["image_url"]
+
+    if not validate_not_empty(title, category, description, start_date):
+        errors.append("Please enter data in all fields")
+
+    if category and not validate_category(category):
+        errors.append("Please pick a valid category")
+
+    if description and not validate_description(description):
+        errors.append("Please provide a description for the opportunity")
+
+    if start_date and not validate_date(start_date):
+        errors.append("Please provide valid Start date")
+
+    if end_date and not validate_date(end_date):
+        errors.append("Please provide valid End date")
+
+    if max_signups and not validate_max_signups(max_signups):
+        errors.append("Maximum Signups needs to be an integer greater than 0")
+
+    if image_url and not validate_https_url(image_url):
+        errors.append("Image URL needs to be an https link")
+
+    # only compare the dates once they are known to be valid
+    if errors:
+        return errors
+
+    if end_date:
+        if not validate_start_end_dates(start_date, end_date):
+            errors.append("The Start date cannot be greater than End date")
+        elif not compare_date_with_today(start_date) and not compare_date_with_today(
+                end_date
+        ):
+            errors.append("You can only add future opportunities")
+    elif not compare_date_with_today(start_date):
+        errors.append("You can only add future opportunities")
+
+    return errors
+
+
+# validates every row in one pass and returns (opportunities, errors), where each
+# error holds the csv line number and all the messages for that line
+def parse_opportunity_csv(csv_file):
+    opportunities = []
+    errors = []
+
+    # one byte over the limit is enough to tell the file is too big
+    content = csv_file.read(OPPORTUNITY_CSV_MAX_BYTES + 1)
+    if len(content) > OPPORTUNITY_CSV_MAX_BYTES:
+        errors.append(
+            {
+                "row": None,
+                "messages": [
+                    f"The file must not be larger than {OPPORTUNITY_CSV_MAX_BYTES // 1024} KB"
+                ],
+            }
+        )
+        return opportunities, errors
+
+    try:
+        content = content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        errors.append({"row": None, "messages": ["The file must be UTF-8 encoded"]})
+        return opportunities, errors
+
+    reader = csv.DictReader(io.StringIO(content))
+    headers = [h.strip().lower() for h in (reader.fieldnames or [])]
+
+    missing_columns = [c for c in REQUIRED_OPPORTUNITY_CSV_COLUMNS if c not in headers]
+    if missing_columns:
+        errors.append(
+            {
+                "row": None,
+                "messages": ["Missing columns: " + ", ".join(missing_columns)],
+            }
+        )
+        return opportunities, errors
+
+    reader.fieldnames = headers
+
+    seen_titles = {}
+    for raw_row in reader:
+        line = reader.line_num
+        row = {
+            column: (raw_row.get(column) or "").strip()
+            for column in OPPORTUNITY_CSV_COLUMNS
+        }
+
+        row_errors = validate_opportunity_row(row)
+
+        title = row["title"]
+        if title in seen_titles:
+            row_errors.append(
+                f"Duplicate title, already used on line {seen_titles[title]}"
+            )
+        elif title:
+            seen_titles[title] = line
+
+        if row_errors:
+            errors.append({"row": line, "messages": row_errors})
+            continue
+
+        opportunities.append(
+            {
+                "row": line,
+                "title": title,
+                "opp_image_url": row["image_url"],
+                "description": f"<p>{escape(row['description'])}</p>",
+                "category": row["category"],
+                "start_date": row["start_date"],
+                "end_date": row["end_date"] or None,
+                "max_signups": (
+                    int(row["max_signups"]) if row["max_signups"] else None
+                ),
+            }
+        )
+
+    if not opportunities and not errors:
+        errors.append({"row": None, "messages": ["The file does not contain any rows"]})
+
+    return opportunities, errors
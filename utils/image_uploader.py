@@ -1,4 +1,7 @@
+import logging
 import os
+import re
+from urllib.parse import urlsplit
 
 import cloudinary.uploader
 from dotenv import load_dotenv
@@ -16,3 +19,79 @@ cloudinary.config(
 def upload_image(image_file):
     response = cloudinary.uploader.upload(file=image_file, folder="utd-link")
     return response["secure_url"]
+
+
+# widths offered to the browser in srcset, it picks one from the rendered
+# size of the image and the screen's pixel density
+IMAGE_WIDTHS = (320, 480, 640, 960, 1280)
+
+CLOUDINARY_HOST = "res.cloudinary.com"
+CLOUDINARY_UPLOAD_PATH = "/image/upload/"
+
+
+def is_cloudinary_url(url: str) -> bool:
+    if not url:
+        return False
+
+    parts = urlsplit(url)
+    return parts.netloc == CLOUDINARY_HOST and CLOUDINARY_UPLOAD_PATH in parts.path
+
+
+# the public id of an uploaded image, its path after the optional version
+# without the file extension, e.g. utd-link/abc for .../upload/v12/utd-link/abc.png
+def cloudinary_public_id(url: str):
+    if not is_cloudinary_url(url):
+        return None
+
+    path = urlsplit(url).path.split(CLOUDINARY_UPLOAD_PATH, 1)[1]
+    path = re.sub(r"^v\d+/", "", path)
+    return os.path.splitext(path)[0]
+
+
+# removes an image upload_image stored for a row that could not be saved after
+# all. a failure only leaves the asset behind, so it is logged and not raised
+def delete_uploaded_image(url: str):
+    public_id = cloudinary_public_id(url)
+    if public_id is None:
+        return
+
+    try:
+        cloudinary.uploader.destroy(public_id, invalidate=True)
+    except Exception:
+        logging.getLogger(__name__).warning(
+            "could not delete uploaded image %s", public_id, exc_info=True
+        )
+
+
+# a derivative of an uploaded image that cloudinary resizes to at most width
+# pixels and serves in the best format the browser accepts. with an aspect
+# ratio it is cropped to it around the interesting part of the image. urls
+# from anywhere else are returned unchanged
+def image_url(url: str, width: int, aspect_ratio: str = None) -> str:
+    if not is_cloudinary_url(url):
+        return url
+
+    if aspect_ratio:
+        transformation = f"c_fill,g_auto,ar_{aspect_ratio},w_{width},f_auto,q_auto"
+    else:
+        transformation = f"c_limit,w_{width},f_auto,q_auto"
+
+    prefix, rest = url.split(CLOUDINARY_UPLOAD_PATH, 1)
+    return f"{prefix}{CLOUDINARY_UPLOAD_PATH}{transformation}/{rest}"
+
+
+# empty for urls without derivatives, the browser then just uses src
+def image_srcset(url: str, aspect_ratio: str = None, widths=IMAGE_WIDTHS) -> str:
+    if not is_cloudinary_url(url):
+        return ""
+
+    return ", ".join(
+        f"{image_url(url, width, aspect_ratio)} {width}w" for width in widths
+    )
+
+
+# every flask app rendering the templates needs these, the app and the
+# template benchmark alike
+def register_template_filters(app):
+    app.add_template_filter(image_url)
+    app.add_template_filter(image_srcset)
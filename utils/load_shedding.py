@@ -0,0 +1,79 @@
+import json
+import os
+import threading
+from functools import wraps
+
+from flask import make_response, request
+
+OVERLOADED_MESSAGE = "The server is busy right now, please try again in a moment"
+
+
+def overloaded_response():
+    if request.headers.get("HX-Request"):
+        response = make_response("", 503)
+        response.headers["HX-Trigger"] = json.dumps(
+            {
+                "showToast": {
+                    "message": OVERLOADED_MESSAGE,
+                    "type": "error",
+                    "fromHTMX": True,
+                }
+            }
+        )
+    else:
+        response = make_response(OVERLOADED_MESSAGE, 503)
+
+    response.headers["Retry-After"] = "1"
+    return response
+
+
+# caps how many requests of one kind run at once. a request over the limit is
+# turned away straight away instead of waiting for a slot, so expensive pages
+# can not hold every db connection while the cheap routes queue behind them
+class ConcurrencyLimiter:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.rejected = 0
+
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        if self._slots.acquire(blocking=False):
+            return True
+
+        with self._lock:
+            self.rejected += 1
+
+        return False
+
+    def release(self):
+        self._slots.release()
+
+
+limiters = {}
+
+
+# routes sharing a name share the limit, MAX_CONCURRENT_<NAME> overrides it
+def get_limiter(name: str, default_limit: int) -> ConcurrencyLimiter:
+    limit = int(os.getenv(f"MAX_CONCURRENT_{name.upper()}", str(default_limit)))
+    return limiters.setdefault(name, ConcurrencyLimiter(limit))
+
+
+def limit_concurrency(name: str, default_limit: int):
+    limiter = get_limiter(name, default_limit)
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not limiter.acquire():
+                return overloaded_response()
+
+            try:
+                return f(*args, **kwargs)
+            finally:
+                limiter.release()
+
+        return decorated_function
+
+    return decorator
@@ -0,0 +1,9 @@
+import os
+
+from utils.cache import make_cache
+
+ORG_TYPE_COUNTS_TTL = float(os.getenv("ORG_TYPE_COUNTS_TTL", "300"))
+
+# org_type -> number of organizations of that type, for the dashboard filter.
+# dropped whenever an organization is created, updated or deleted
+org_type_counts_cache = make_cache("org_type_counts", ORG_TYPE_COUNTS_TTL)
@@ -0,0 +1,130 @@
+import cProfile
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+from itsdangerous import BadSignature, TimestampSigner
+
+PROFILE_HEADER = "X-Profile-Token"
+
+
+def _signer(secret_key: str) -> TimestampSigner:
+    return TimestampSigner(secret_key, salt="request-profiler")
+
+
+def make_profile_token(secret_key: str) -> str:
+    return _signer(secret_key).sign("profile").decode("utf-8")
+
+
+def is_valid_profile_token(token: str, secret_key: str, max_age: int) -> bool:
+    try:
+        _signer(secret_key).unsign(token, max_age=max_age)
+    except BadSignature:
+        return False
+
+    return True
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+# profiles a single request. cProfile gives exact call counts and times for
+# the request thread, and a sampler thread records its stack every interval
+# for the collapsed stack output that flamegraph tools read
+class ProfileRun:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks = Counter()
+
+        self._profile = cProfile.Profile()
+        self._thread_id = threading.get_ident()
+        self._done = threading.Event()
+        self._sampler = threading.Thread(
+            target=self._sample, name="request-profiler", daemon=True
+        )
+        self._started_at = 0.0
+        self.duration = 0.0
+
+    def start(self):
+        self._started_at = time.perf_counter()
+        self._sampler.start()
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+        self._done.set()
+        self._sampler.join()
+        self.duration = time.perf_counter() - self._started_at
+
+    def _sample(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def dump(self, output_dir: str, tags: dict) -> str:
+        os.makedirs(output_dir, exist_ok=True)
+
+        tag_part = "-".join(
+            f"{key}_{re.sub(r'[^A-Za-z0-9_.]', '_', str(value))}"
+            for key, value in tags.items()
+        )
+        base = os.path.join(
+            output_dir,
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{tag_part}-{self.duration * 1000:.0f}ms",
+        )
+
+        self._profile.dump_stats(base + ".prof")
+
+        with open(base + ".collapsed", "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        return base
+
+
+# hands out profile runs to requests carrying a valid signed token, at most
+# max_per_minute of them, so it is safe to leave enabled in production
+class RequestProfiler:
+    def __init__(self, output_dir: str, max_per_minute: int, interval: float = 0.005):
+        self.output_dir = output_dir
+        self.max_per_minute = max_per_minute
+        self.interval = interval
+
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+
+        with self._lock:
+            while self._recent and self._recent[0] <= now - 60:
+                self._recent.popleft()
+
+            if len(self._recent) >= self.max_per_minute:
+                return False
+
+            self._recent.append(now)
+            return True
+
+    def start(self) -> ProfileRun:
+        run = ProfileRun(self.interval)
+        run.start()
+        return run
+
+
+request_profiler = RequestProfiler(
+    output_dir=os.getenv("PROFILER_DIR", "profiles"),
+    max_per_minute=int(os.getenv("PROFILER_MAX_PER_MINUTE", "6")),
+)
@@ -0,0 +1,46 @@
+import os
+from collections import Counter
+
+# off: nothing is checked. warn: overruns are logged. strict: overruns raise,
+# meant for tests and benchmarks/query_budgets.py
+QUERY_BUDGET_MODE = os.getenv("QUERY_BUDGET_MODE", "warn").lower()
+
+# the same statement running more often than this in one request is an N+1
+QUERY_REPEAT_LIMIT = int(os.getenv("QUERY_REPEAT_LIMIT", "3"))
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+# declares how many statements a route may run per request. put it right above
+# the view function so functools.wraps carries it through the other decorators.
+# routes that do not declare a budget may not query at all
+def query_budget(max_queries: int):
+    def decorator(f):
+        f.query_budget = max_queries
+        return f
+
+    return decorator
+
+
+def statement_text(query) -> str:
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+
+    return " ".join(str(query).split())
+
+
+def query_budget_problems(view, queries: list) -> list:
+    budget = getattr(view, "query_budget", 0)
+    problems = []
+
+    if len(queries) > budget:
+        problems.append(f"ran {len(queries)} queries, its budget is {budget}")
+
+    repeats = Counter(statement_text(query) for query in queries)
+    for statement, count in repeats.items():
+        if count > QUERY_REPEAT_LIMIT:
+            problems.append(f"ran the same statement {count} times: {statement[:120]}")
+
+    return problems
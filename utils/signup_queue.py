@@ -0,0 +1,125 @@
+import os
+import queue
+import threading
+import time
+import uuid
+
+from db.queries import create_new_signups_batch
+from utils.cache import MISSING, make_cache
+
+SIGNUP_QUEUE_ENABLED = os.getenv("SIGNUP_QUEUE_ENABLED", "false").lower() == "true"
+
+# how long the outcome of a queued signup can be polled for
+SIGNUP_RESULT_TTL = float(os.getenv("SIGNUP_RESULT_TTL", "300"))
+
+# ticket -> {"user_id", "opp_id", "status"} of every queued signup. with
+# CACHE_BACKEND=redis the status poll can land on any worker process, not only
+# the one that queued the signup. there is no local copy, so a poll never sees
+# a pending status the worker already replaced
+signup_results_cache = make_cache("signup_results", SIGNUP_RESULT_TTL, near_ttl=0)
+
+
+# bounded in-process queue for signups. requests get a ticket straight away and
+# a single worker thread inserts the queued signups in batches, so the number
+# of commits stays bounded however many students sign up at once
+class SignupQueue:
+    def __init__(
+            self,
+            maxsize: int,
+            batch_size: int,
+            batch_wait: float,
+            results=signup_results_cache,
+    ):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.results = results
+
+        self._queue = queue.Queue(maxsize)
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def enqueue(self, user_id: int, opp_id: int):
+        self._ensure_worker()
+
+        ticket = uuid.uuid4().hex
+        self._set_status(ticket, user_id, opp_id, "pending")
+
+        try:
+            self._queue.put_nowait((ticket, user_id, opp_id))
+        except queue.Full:
+            self.results.invalidate(ticket)
+            return None
+
+        return ticket
+
+    def get_result(self, ticket: str):
+        result = self.results.get(ticket)
+
+        if result is MISSING:
+            return None
+
+        return dict(result)
+
+    def _set_status(self, ticket: str, user_id: int, opp_id: int, status: str):
+        self.results.set(
+            ticket, {"user_id": user_id, "opp_id": opp_id, "status": status}
+        )
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="signup-queue", daemon=True
+                )
+                self._worker.start()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    # a batch that fails as a whole, e.g. on a signup another process inserted
+    # meanwhile, is retried one request at a time so only the bad ones fail
+    def _insert(self, batch: list) -> list:
+        signup_requests = [(user_id, opp_id) for _, user_id, opp_id in batch]
+
+        try:
+            return create_new_signups_batch(signup_requests)
+        except Exception:
+            if len(signup_requests) == 1:
+                return ["error"]
+
+        outcomes = []
+        for signup_request in signup_requests:
+            try:
+                outcomes += create_new_signups_batch([signup_request])
+            except Exception:
+                outcomes.append("error")
+
+        return outcomes
+
+    def _process(self, batch: list):
+        for (ticket, user_id, opp_id), outcome in zip(batch, self._insert(batch)):
+            self._set_status(ticket, user_id, opp_id, outcome)
+
+    def _run(self):
+        while True:
+            self._process(self._next_batch())
+
+
+signup_queue = SignupQueue(
+    maxsize=int(os.getenv("SIGNUP_QUEUE_SIZE", "5000")),
+    batch_size=int(os.getenv("SIGNUP_BATCH_SIZE", "200")),
+    batch_wait=float(os.getenv("SIGNUP_BATCH_WAIT", "0.05")),
+)
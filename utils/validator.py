@@ -1,5 +1,6 @@
 import re
 from datetime import datetime, date
+from urllib.parse import urlsplit
 
 
 def validate_email(email: str):
@@ -27,6 +28,30 @@ def validate_role(role: str) -> bool:
     return role in ["student", "faculty"]
 
 
+def validate_category(category: str) -> bool:
+    return category in [
+        "career_development",
+        "career_fair",
+        "competition",
+        "conference",
+        "guest_lecture",
+        "hackathon",
+        "internship_info",
+        "networking_event",
+        "panel_discussion",
+        "research_opportunity",
+        "seminar",
+        "social_event",
+        "training_session",
+        "volunteering",
+        "workshop",
+    ]
+
+
+def validate_signup_status(status: str) -> bool:
+    return status in ["pending", "approved", "rejected", "cancelled", "attended"]
+
+
 def validate_description(description: str) -> bool:
     return description != "<p><br></p>"
 
@@ -93,3 +118,10 @@ def validate_max_signups(max_signups: str) -> bool:
         return False
 
     return True
+
+
+# only https links to a host, so an imported image never loads over plain http
+# or from a javascript: or data: url
+def validate_https_url(url: str) -> bool:
+    parts = urlsplit(url)
+    return parts.scheme == "https" and bool(parts.netloc)